@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtCore import QEvent, QT_VERSION_STR, PYQT_VERSION_STR
+
+app = QApplication.instance() or QApplication(sys.argv)
+
+import highlighter
+from completion import FuzzyCompletionModel, FuzzyMatcher
+from editor import CodeEditor
+
+KINDS = ('docstring', 'strings', 'nested')
+DEFAULT_SIZES = (1000, 10000, 50000, 200000)
+
+
+# ------------------------
+# Synthetic sources
+# ------------------------
+def _docstring_unit(rng, i):
+    return [
+        f"def function_{i}(value, *args, **kwargs):",
+        '    """Return the processed value.',
+        "",
+        f"    Handles case {rng.randint(0, 999)} with 'quotes' and (brackets) in prose.",
+        "    >>> function(1)",
+        '    """',
+        f"    return value * {rng.random():.4f}  # scaled",
+        "",
+    ]
+
+
+def _strings_unit(rng, i):
+    return [
+        f"RECORD_{i} = {{",
+        f"    'id': {i}, 'name': \"item-{rng.randint(0, 99999)}\", 'tags': ['a', 'b', 'c'],",
+        f"    'query': 'SELECT * FROM table WHERE id = {i} AND name LIKE \"%x%\"',",
+        f"    'path': r'C:\\data\\file_{i}.txt', 'fmt': f'{{value!r:>10}} {i}',",
+        "    'blob': b'\\x00\\x01\\x02', 'note': '''single line triple''',",
+        "}",
+    ]
+
+
+def _nested_unit(rng, i):
+    depth = rng.randint(3, 8)
+    lines = [f"class Node{i}(Base):"]
+    for level in range(1, depth):
+        indent = "    " * level
+        lines.append(f"{indent}if self.level_{level} and (x[{level}] or {{'k': [{level}, ({level},)]}}):")
+    lines.append("    " * depth + f"return cls.compute(lambda v: v ** {depth} // 2, data=[[{i}]])")
+    return lines
+
+
+_UNITS = {'docstring': _docstring_unit, 'strings': _strings_unit, 'nested': _nested_unit}
+
+
+def generate_source(kind, line_count, seed=0):
+    rng = random.Random(f"{kind}-{seed}")
+    unit = _UNITS[kind]
+    lines = []
+    i = 0
+    while len(lines) < line_count:
+        lines.extend(unit(rng, i))
+        i += 1
+    return "\n".join(lines[:line_count])
+
+
+# ------------------------
+# Measurements
+# ------------------------
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'mean': statistics.fmean(samples),
+        'p50': samples[len(samples) // 2],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max': samples[-1],
+    }
+
+
+def _make_editor(text, lazy):
+    editor = CodeEditor()
+    editor.highlighter.lazy = lazy
+    editor.resize(1000, 800)
+    editor.show()
+    app.processEvents()
+    editor.setPlainText(text)
+    app.processEvents()
+    return editor
+
+
+def _dispose(editor):
+    # Free the document and its highlighter before the next measurement.
+    editor.close()
+    editor.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+    app.processEvents()
+
+
+def bench_full_rehighlight(text):
+    editor = _make_editor(text, lazy=False)
+    highlighter.highlight_cache.clear()
+    cold = _timed(editor.highlighter.rehighlight)
+    warm = _timed(editor.highlighter.rehighlight)
+    _dispose(editor)
+    return {'cold': cold, 'warm': warm}
+
+
+def bench_keystroke(text, samples=50):
+    editor = _make_editor(text, lazy=False)
+    document = editor.document()
+    rng = random.Random(1)
+    block_times, key_times = [], []
+    for _ in range(samples):
+        block = document.findBlockByNumber(rng.randrange(document.blockCount()))
+        highlighter.highlight_cache.clear()
+        block_times.append(_timed(lambda: editor.highlighter.rehighlightBlock(block)))
+
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock)
+        highlighter.highlight_cache.clear()
+        key_times.append(_timed(lambda: cursor.insertText("x")))
+    _dispose(editor)
+    return {'highlight_block': _summary(block_times), 'insert_char': _summary(key_times)}
+
+
+def bench_load(text):
+    results = {}
+    for mode, lazy in (('lazy', True), ('eager', False)):
+        editor = CodeEditor()
+        editor.highlighter.lazy = lazy
+        editor.resize(1000, 800)
+        editor.show()
+        app.processEvents()
+        highlighter.highlight_cache.clear()
+
+        def load():
+            editor.setPlainText(text)
+            # Includes QSyntaxHighlighter's delayed first rehighlight.
+            app.processEvents()
+
+        results[mode] = _timed(load)
+        _dispose(editor)
+    return results
+
+
+def bench_line_number_paint(text, samples=30):
+    editor = _make_editor(text, lazy=True)
+    scrollbar = editor.verticalScrollBar()
+    rng = random.Random(2)
+    times = []
+    for _ in range(samples):
+        scrollbar.setValue(rng.randrange(scrollbar.maximum() + 1))
+        app.processEvents()
+        times.append(_timed(editor.lineNumberArea.repaint))
+    _dispose(editor)
+    return _summary(times)
+
+
+_NAME_PARTS = ('get', 'set', 'value', 'item', 'node', 'parse', 'load', 'index', 'cache',
+               'buffer', 'line', 'token', 'state', 'text', 'block', 'result', 'config', 'path')
+_QUERIES = ('gvi', 'pt', 'lineb', 'ci', 'stx')
+
+
+def completion_candidates(count, seed=0):
+    # snake_case and CamelCase names, count of them, like a big workspace.
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        parts = rng.sample(_NAME_PARTS, rng.randint(1, 3))
+        if rng.random() < 0.3:
+            names.add(''.join(part.title() for part in parts) + str(rng.randrange(1000)))
+        else:
+            names.add('_'.join(parts) + f'_{rng.randrange(1000)}')
+    return sorted(names)
+
+
+def bench_fuzzy_completion(text):
+    # One candidate per line of the source, so --sizes sets the list size.
+    candidates = completion_candidates(text.count('\n') + 1)
+    model = FuzzyCompletionModel(matcher=FuzzyMatcher())
+    keystrokes = []
+    for query in _QUERIES:
+        model.set_candidates(candidates)
+        for length in range(1, len(query) + 1):
+            keystrokes.append(_timed(lambda: model.set_query(query[:length])))
+    return {'candidates': len(candidates), 'keystroke': _summary(keystrokes)}
+
+
+BENCHMARKS = {
+    'full_rehighlight': bench_full_rehighlight,
+    'keystroke': bench_keystroke,
+    'load': bench_load,
+    'line_number_paint': bench_line_number_paint,
+    'fuzzy_completion': bench_fuzzy_completion,
+}
+
+
+# Results that count something rather than time it, by last key; they
+# are recorded for context but never compared.
+COUNT_METRICS = {'candidates'}
+
+
+def is_timing(key):
+    return key.rsplit('/', 1)[-1] not in COUNT_METRICS
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}/{key}", item, out)
+    else:
+        out[prefix] = value
+    return out
+
+
+def run(kinds, sizes, benchmarks, log=print):
+    results = {}
+    for kind in kinds:
+        for size in sizes:
+            text = generate_source(kind, size)
+            for name in benchmarks:
+                log(f"{kind:>9} {size:>7} lines  {name}...")
+                _flatten(f"{kind}/{size}/{name}", BENCHMARKS[name](text), results)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, value in sorted(results.items()):
+        if not is_timing(key):
+            continue
+        old = baseline.get(key)
+        if old and value > old * (1 + threshold):
+            regressions.append((key, old, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the editor hot paths.")
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON file from an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run(args.kinds, args.sizes, args.benchmarks)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'pyqt': PYQT_VERSION_STR,
+            'platform': platform.platform(),
+            'engine': highlighter.DEFAULT_ENGINE,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Wrote {len(results)} measurements to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for key, old, new in regressions:
+            print(f"REGRESSION {key}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions against", args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
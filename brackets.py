@@ -0,0 +1,299 @@
+import random
+
+OPENING_BRACKETS = '([{'
+CLOSING_BRACKETS = ')]}'
+BRACKET_PAIRS = {'(': ')', '[': ']', '{': '}', ')': '(', ']': '[', '}': '{'}
+
+
+def _summarize(chars):
+    # (net depth change, lowest running depth, highest depth reached
+    # reading from the end backwards), all relative to 0.
+    depth = lowest = 0
+    for char in chars:
+        depth += 1 if char in OPENING_BRACKETS else -1
+        if depth < lowest:
+            lowest = depth
+    depth = highest = 0
+    for char in reversed(chars):
+        depth += 1 if char in OPENING_BRACKETS else -1
+        if depth > highest:
+            highest = depth
+    return depth, lowest, highest
+
+
+class _Node:
+    # One block in the tree, in document order: own is the block's
+    # summary, the rest cover the node's whole subtree.
+    __slots__ = ('left', 'right', 'size', 'own', 'sum', 'low', 'high')
+
+    def __init__(self, own):
+        self.left = self.right = None
+        self.own = own
+
+
+def _pull(node):
+    # Summary of left subtree, then the node's block, then right subtree.
+    total, low, high = node.own
+    size = 1
+    left = node.left
+    if left is not None:
+        size += left.size
+        low = min(left.low, left.sum + low)
+        high = max(high, total + left.high)
+        total += left.sum
+    right = node.right
+    if right is not None:
+        size += right.size
+        low = min(low, total + right.low)
+        high = max(right.high, right.sum + high)
+        total += right.sum
+    node.size, node.sum, node.low, node.high = size, total, low, high
+
+
+def _build_tree(summaries, first, last):
+    # Balanced subtree over summaries[first:last].
+    if first >= last:
+        return None
+    middle = (first + last) // 2
+    node = _Node(summaries[middle])
+    node.left = _build_tree(summaries, first, middle)
+    node.right = _build_tree(summaries, middle + 1, last)
+    _pull(node)
+    return node
+
+
+def _split(node, count):
+    # (first count blocks, the rest)
+    if node is None:
+        return None, None
+    left_size = node.left.size if node.left is not None else 0
+    if count <= left_size:
+        head, node.left = _split(node.left, count)
+        _pull(node)
+        return head, node
+    node.right, tail = _split(node.right, count - left_size - 1)
+    _pull(node)
+    return node, tail
+
+
+def _merge(head, tail):
+    # Either root is kept with a chance proportional to its size, which
+    # keeps the expected depth logarithmic (a randomized binary search tree).
+    if head is None:
+        return tail
+    if tail is None:
+        return head
+    if random.random() * (head.size + tail.size) < head.size:
+        head.right = _merge(head.right, tail)
+        _pull(head)
+        return head
+    tail.left = _merge(head, tail.left)
+    _pull(tail)
+    return tail
+
+
+def _forward(node, offset, number, depth):
+    # Search the blocks from number on in node's subtree, whose first
+    # block is offset. Returns (block or None, depth).
+    if node is None:
+        return None, depth
+    if offset >= number:
+        if depth + node.low >= 0:
+            return None, depth + node.sum
+        while True:
+            left = node.left
+            if left is not None:
+                if depth + left.low < 0:
+                    node = left
+                    continue
+                depth += left.sum
+                offset += left.size
+            total, low, _ = node.own
+            if depth + low < 0:
+                return offset, depth
+            depth += total
+            offset += 1
+            node = node.right
+    index = offset + (node.left.size if node.left is not None else 0)
+    if number < index:
+        found, depth = _forward(node.left, offset, number, depth)
+        if found is not None:
+            return found, depth
+    if number <= index:
+        total, low, _ = node.own
+        if depth + low < 0:
+            return index, depth
+        depth += total
+    return _forward(node.right, index + 1, number, depth)
+
+
+def _backward(node, offset, number, depth):
+    # Search the blocks up to number in node's subtree, last first.
+    if node is None:
+        return None, depth
+    if offset + node.size - 1 <= number:
+        if depth + node.high <= 0:
+            return None, depth + node.sum
+        while True:
+            index = offset + (node.left.size if node.left is not None else 0)
+            right = node.right
+            if right is not None:
+                if depth + right.high > 0:
+                    node = right
+                    offset = index + 1
+                    continue
+                depth += right.sum
+            total, _, high = node.own
+            if depth + high > 0:
+                return index, depth
+            depth += total
+            node = node.left
+    index = offset + (node.left.size if node.left is not None else 0)
+    if number > index:
+        found, depth = _backward(node.right, index + 1, number, depth)
+        if found is not None:
+            return found, depth
+    if number >= index:
+        total, _, high = node.own
+        if depth + high > 0:
+            return index, depth
+        depth += total
+    return _backward(node.left, offset, number, depth)
+
+
+class BracketIndex:
+    """Brackets outside strings and comments, per block, for O(log n) matching.
+
+    Each block keeps the columns and characters of its brackets. A balanced
+    tree over the blocks stores, per subtree, the net depth change, the
+    lowest prefix depth and the highest suffix depth, which is enough to
+    find the block holding a bracket's partner without looking at the
+    blocks between. Text edits inside a block update one path of the tree,
+    and blocks are inserted and removed by splitting and joining it, so
+    neither costs more than O(log n) plus the blocks added. The tree is
+    built the first time it is queried.
+    """
+
+    def __init__(self, block_count=1):
+        self.reset(block_count)
+
+    def reset(self, block_count):
+        self._blocks = [None] * block_count
+        self._root = None
+        self._built = False
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def splice(self, first, removed, added):
+        self._blocks[first:first + removed] = [None] * added
+        if self._built:
+            head, rest = _split(self._root, first)
+            _, tail = _split(rest, removed)
+            middle = _build_tree([(0, 0, 0)] * added, 0, added)
+            self._root = _merge(_merge(head, middle), tail)
+
+    def set_block(self, number, columns, chars):
+        if number >= len(self._blocks):
+            return
+        if self.brackets(number) == (columns, chars):
+            return
+        entry = (columns, chars, _summarize(chars)) if chars else None
+        self._blocks[number] = entry
+        if self._built:
+            self._update(number, entry[2] if entry else (0, 0, 0))
+
+    def brackets(self, number):
+        entry = self._blocks[number] if 0 <= number < len(self._blocks) else None
+        return entry[:2] if entry is not None else ((), '')
+
+    def bracket_at(self, number, column):
+        columns, chars = self.brackets(number)
+        for i, col in enumerate(columns):
+            if col == column:
+                return chars[i]
+        return None
+
+    # ------------------------
+    # Tree
+    # ------------------------
+    def _build(self):
+        summaries = [entry[2] if entry is not None else (0, 0, 0) for entry in self._blocks]
+        self._root = _build_tree(summaries, 0, len(summaries))
+        self._built = True
+
+    def _update(self, number, summary):
+        path = []
+        node = self._root
+        while True:
+            path.append(node)
+            left_size = node.left.size if node.left is not None else 0
+            if number < left_size:
+                node = node.left
+            elif number == left_size:
+                break
+            else:
+                number -= left_size + 1
+                node = node.right
+        node.own = summary
+        for node in reversed(path):
+            _pull(node)
+
+    def _find_forward(self, number, depth):
+        # First block at or after number where the running depth, starting
+        # at depth, drops below zero. Returns (block, depth entering it).
+        found, depth = _forward(self._root, 0, number, depth)
+        return None if found is None else (found, depth)
+
+    def _find_backward(self, number, depth):
+        # Last block at or before number where the depth counted backwards
+        # from its end, starting at depth, rises above zero.
+        found, depth = _backward(self._root, 0, number, depth)
+        return None if found is None else (found, depth)
+
+    # ------------------------
+    # Matching
+    # ------------------------
+    def match(self, number, column):
+        """Return (block, column) of the partner of the bracket at (number,
+        column), or None when there is no bracket there or it is unbalanced.
+        """
+        columns, chars = self.brackets(number)
+        try:
+            position = columns.index(column)
+        except ValueError:
+            return None
+        if not self._built:
+            self._build()
+
+        if chars[position] in OPENING_BRACKETS:
+            depth = 0
+            for i in range(position + 1, len(chars)):
+                depth += 1 if chars[i] in OPENING_BRACKETS else -1
+                if depth < 0:
+                    return number, columns[i]
+            found = self._find_forward(number + 1, depth)
+            if found is None:
+                return None
+            number, depth = found
+            columns, chars, _ = self._blocks[number]
+            for i, char in enumerate(chars):
+                depth += 1 if char in OPENING_BRACKETS else -1
+                if depth < 0:
+                    return number, columns[i]
+        else:
+            depth = 0
+            for i in range(position - 1, -1, -1):
+                depth += 1 if chars[i] in OPENING_BRACKETS else -1
+                if depth > 0:
+                    return number, columns[i]
+            found = self._find_backward(number - 1, depth)
+            if found is None:
+                return None
+            number, depth = found
+            columns, chars, _ = self._blocks[number]
+            for i in range(len(chars) - 1, -1, -1):
+                depth += 1 if chars[i] in OPENING_BRACKETS else -1
+                if depth > 0:
+                    return number, columns[i]
+        return None
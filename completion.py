@@ -0,0 +1,325 @@
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from functools import lru_cache
+import heapq
+import importlib.util
+import keyword
+import re
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+# Jedi itself is only imported by langserver.py, in its own process.
+HAS_JEDI = importlib.util.find_spec('jedi') is not None
+
+
+BASE_COMPLETIONS = frozenset(keyword.kwlist + [
+    'print', 'input', 'len', 'open', 'range', 'str', 'int', 'float',
+    'list', 'dict', 'set', 'type', 'isinstance', 'super', 'dir'
+])
+
+_SYMBOL_RES = (
+    re.compile(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\s*='),
+    re.compile(r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\('),
+    re.compile(r'class\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*[:\(]'),
+    re.compile(r'import\s+([a-zA-Z0-9_\.]+)'),
+)
+
+
+def block_symbols(text):
+    symbols = set()
+    for pattern in _SYMBOL_RES:
+        symbols.update(pattern.findall(text))
+    symbols.discard('')
+    return tuple(symbols)
+
+
+class SymbolTable:
+    """Names assigned, defined or imported in a document, kept per block.
+
+    replace() is fed the blocks an edit touched; a name stays a candidate
+    while any block still defines it, and candidates() is kept sorted so
+    the completer model can use it as is. It returns a new tuple after
+    every change, so callers may cache on the object it returns.
+    """
+
+    def __init__(self):
+        self._blocks = [()]
+        self._counts = Counter()
+        self._sorted = sorted(BASE_COMPLETIONS)
+        self._candidates = None
+        self.version = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def replace(self, first, removed, texts):
+        new = [block_symbols(text) for text in texts]
+        old = self._blocks[first:first + removed]
+        self._blocks[first:first + removed] = new
+        if old == new:
+            return
+        changed = False
+        for symbols in new:
+            for name in symbols:
+                self._counts[name] += 1
+                if self._counts[name] == 1 and name not in BASE_COMPLETIONS:
+                    insort(self._sorted, name)
+                    changed = True
+        for symbols in old:
+            for name in symbols:
+                self._counts[name] -= 1
+                if not self._counts[name]:
+                    del self._counts[name]
+                    if name not in BASE_COMPLETIONS:
+                        del self._sorted[bisect_left(self._sorted, name)]
+                        changed = True
+        if changed:
+            self.version += 1
+            self._candidates = None
+
+    def candidates(self):
+        if self._candidates is None:
+            self._candidates = tuple(self._sorted)
+        return self._candidates
+
+
+# ------------------------
+# Fuzzy matching
+# ------------------------
+def fuzzy_pattern(query):
+    """Compile a prefilter for query over newline-joined names: each name
+    holding the query's characters in order, ignoring case. The character
+    classes never overlap, so the scan does not backtrack."""
+    parts = ['(?m)^']
+    for char in query:
+        chars = re.escape(char.lower() + char.upper() if char.isalpha() else char)
+        parts.append(f'[^{chars}\\n]*[{chars}]')
+    parts.append('.*')
+    return re.compile(''.join(parts))
+
+
+_WORD_START_RE = re.compile(r'(?<![A-Za-z0-9])[A-Za-z0-9]|(?<=[a-z0-9])[A-Z]')
+
+
+@lru_cache(maxsize=1 << 18)
+def _profile(name):
+    # (lowercase name, lowercase word initials, their positions)
+    starts = [match.start() for match in _WORD_START_RE.finditer(name)]
+    lowered = name.lower()
+    return lowered, ''.join(lowered[i] for i in starts), starts
+
+
+def fuzzy_score(name, query):
+    """Score name against query (higher is better), or None if it does not
+    match. The first character has to start a word (snake_case or camelCase);
+    matches at word starts, runs of consecutive characters and exact case
+    are rewarded. Prefix matches always score highest: any other match
+    gets at most 9 points per query character, and a prefix match starts
+    above that, shorter names first."""
+    lowered_query = query.lower()
+    if name[:len(query)].lower() == lowered_query:
+        return 9 * len(query) + 110 + (10 if name.startswith(query) else 0) - min(len(name), 100)
+    lowered, initials, starts = _profile(name)
+    score = 0
+    position = 0
+    for i, char in enumerate(lowered_query):
+        if i and lowered.startswith(char, position):
+            index = position
+            score += 6
+        else:
+            found = initials.find(char, bisect_left(starts, position))
+            if found >= 0:
+                index = starts[found]
+                score += 8
+            elif i == 0:
+                return None
+            else:
+                index = lowered.find(char, position)
+                if index < 0:
+                    return None
+                score -= min(index - position, 5)
+        if name[index] == query[i]:
+            score += 1
+        position = index + 1
+    return score - len(name) // 4
+
+
+class FuzzyMatcher:
+    """Ranks candidates for a query and remembers which ones were used."""
+
+    recent_bonus = 20
+
+    def __init__(self, max_recent=200):
+        self.max_recent = max_recent
+        self._recent = OrderedDict()
+        self._joined = (None, '')
+
+    def record_use(self, name):
+        self._recent.pop(name, None)
+        self._recent[name] = None
+        if len(self._recent) > self.max_recent:
+            self._recent.popitem(last=False)
+
+    def filter(self, candidates, query):
+        """Names of candidates containing query as a subsequence."""
+        if self._joined[0] is not candidates:
+            self._joined = (candidates, '\n'.join(candidates))
+        return fuzzy_pattern(query).findall(self._joined[1])
+
+    def top(self, candidates, query, limit):
+        """Return the best limit candidates for query, best first."""
+        if not query:
+            return heapq.nsmallest(limit, candidates)
+        recent = self._recent
+        bonus = {name: self.recent_bonus * (i + 1) // len(recent)
+                 for i, name in enumerate(recent)} if recent else {}
+        lowered_query = query.lower()
+        length = len(query)
+        prefixed = [name for name in candidates if name[:length].lower() == lowered_query]
+        if len(prefixed) >= limit:
+            best = self._best(prefixed, query, bonus, limit)
+            # No other match can beat 9 points per character plus the bonus.
+            if best[-1][0] >= 9 * len(query) + self.recent_bonus:
+                return [name for _, name in best]
+        return [name for _, name in self._best(candidates, query, bonus, limit)]
+
+    def _best(self, candidates, query, bonus, limit):
+        scored = []
+        for name in candidates:
+            score = fuzzy_score(name, query)
+            if score is not None:
+                scored.append((score + bonus.get(name, 0), name))
+        return heapq.nlargest(limit, scored, key=lambda item: (item[0], _reverse(item[1])))
+
+
+def _reverse(name):
+    # Ties are broken alphabetically (a prefix before its extensions).
+    return [-ord(char) for char in name] + [1]
+
+
+completion_matcher = FuzzyMatcher()
+
+
+class FuzzyCompletionModel(QAbstractListModel):
+    """The completer's model: only the best matches for the current query.
+
+    The full candidate list is never sorted or shown; each query keeps the
+    names that pass the regex prefilter (narrowing the previous survivors
+    while the query only grows) and ranks those with fuzzy_score.
+    """
+
+    def __init__(self, matcher=None, limit=100, parent=None):
+        super().__init__(parent)
+        self.matcher = matcher or completion_matcher
+        self.limit = limit
+        self._candidates = []
+        self._query = None
+        self._matches = None
+        self._rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self._rows[index.row()]
+        return None
+
+    def set_candidates(self, candidates):
+        self._candidates = candidates
+        self._query = None
+        self._matches = None
+
+    def candidates(self):
+        return self._candidates
+
+    def set_query(self, query):
+        if query == self._query:
+            return
+        if not query:
+            matches = self._candidates
+        elif self._query and self._matches is not None and query.startswith(self._query):
+            matches = self.matcher.filter(self._matches, query)
+        else:
+            matches = self.matcher.filter(self._candidates, query)
+        self._query = query
+        self._matches = matches
+        self.beginResetModel()
+        self._rows = self.matcher.top(matches, query, self.limit)
+        self.endResetModel()
+
+
+class CompletionSessionCache:
+    """Engine results for the identifier being typed.
+
+    A session is keyed by (document revision, identifier start). Edits
+    inside the identifier move it to the new revision, any other edit
+    ends it. While it lives, a longer prefix is answered from the stored
+    list, which the completion model narrows, instead of asking the engine
+    again. Engine results are fuzzy, so they are a superset of the
+    matches for any longer prefix.
+    """
+
+    def __init__(self):
+        self._session = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, revision, start, prefix):
+        session = self._session
+        if session is None or session[0] != revision or session[1] != start \
+                or not prefix.startswith(session[3]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return session[4]
+
+    def store(self, revision, start, end, prefix, suggestions):
+        self._session = [revision, start, end, prefix, suggestions]
+
+    def edit(self, position, removed, added, revision):
+        session = self._session
+        if session is None:
+            return
+        if session[1] <= position and position + removed <= session[2]:
+            session[2] += added - removed
+            session[0] = revision
+        else:
+            self._session = None
+
+    def invalidate(self):
+        self._session = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# ------------------------
+# Warm-up
+# ------------------------
+# Standard library modules most code completes against.
+WARM_UP_MODULES = (
+    'builtins', 'os', 'os.path', 'sys', 're', 'collections', 'typing', 'pathlib',
+    'json', 'itertools', 'functools', 'subprocess', 'datetime', 'math',
+)
+
+_IMPORT_RE = re.compile(r'^[ \t]*(?:from[ \t]+([\w.]+)[ \t]+import\b|import[ \t]+([\w., \t]+))', re.M)
+
+
+def imported_modules(source):
+    """Absolute module names imported in source, in order of appearance."""
+    modules = []
+    for match in _IMPORT_RE.finditer(source):
+        if match.group(1):
+            names = [match.group(1)]
+        else:
+            names = [name.split(' as ')[0].strip() for name in match.group(2).split(',')]
+        for name in names:
+            if name and not name.startswith('.') and name not in modules:
+                modules.append(name)
+    return modules
@@ -1,16 +1,168 @@
+from collections import deque
+import time
+
 from PyQt5.QtWidgets import QPlainTextEdit,QTextEdit, QCompleter, QWidget
 from PyQt5.QtGui import QTextCursor, QFont, QPainter, QColor, QTextFormat
-from PyQt5.QtCore import Qt, QStringListModel, QRect, QSize
-import keyword
-import re
+from PyQt5.QtCore import Qt, QObject, QRect, QSize, QTimer, pyqtSignal
+
+from brackets import BRACKET_PAIRS
+from completion import (
+    HAS_JEDI, CompletionSessionCache, FuzzyCompletionModel, SymbolTable, completion_matcher,
+)
+from highlighter import PythonHighlighter, edited_blocks
+from langclient import language_client
+from latency import latency_recorder
+
+
+class CompletionWarmUp(QObject):
+    """Pre-infers modules in the language server so the first completions
+    are served from warm jedi caches.
+
+    Modules are requested one at a time, so a completion request made in
+    the meantime waits behind at most one of them.
+    """
+
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pending = deque()
+        self._queued = set()
+        self._done = 0
+        self._total = 0
+        self._started = 0.0
+        self._running = False
+        self._warmed = set()
+        client = language_client()
+        client.finished.connect(self._on_warmed)
+        client.failed.connect(self._on_warmed)
+        # A restarted server starts with cold caches.
+        client.restarted.connect(self._warmed.clear)
+
+    def is_warmed(self, module):
+        return (language_client().folder, module) in self._warmed
+
+    def start(self, modules):
+        if not HAS_JEDI:
+            return
+        for module in modules:
+            if module not in self._queued and not self.is_warmed(module):
+                self._queued.add(module)
+                self._pending.append(module)
+                self._total += 1
+        if not self._running and self._pending:
+            self._running = True
+            self._started = time.perf_counter()
+            self._submit_next()
+
+    def cancel(self):
+        # The module already requested still finishes.
+        self._queued.difference_update(self._pending)
+        self._total -= len(self._pending)
+        self._pending.clear()
+
+    def _submit_next(self):
+        if not self._pending:
+            self.finished.emit(self._done, time.perf_counter() - self._started)
+            self._running = False
+            self._queued.clear()
+            self._done = self._total = 0
+            return
+        module = self._pending.popleft()
+        self.progress.emit(self._done, self._total, module)
+        language_client().request((self, module), 'warmUp', {'module': module})
+
+    def _on_warmed(self, key, _):
+        if not isinstance(key, tuple) or key[0] is not self:
+            return
+        self._warmed.add((language_client().folder, key[1]))
+        self._done += 1
+        self._submit_next()
+
+
+class ReplaceAllEdit(QObject):
+    """Applies a search.plan_replacements plan to an editor as one undo step.
+
+    Matches are replaced last to first, so the planned positions of the
+    ones still to do stay valid, a few milliseconds at a time. Each run
+    of edits on the same or adjacent lines is one contentsChange, so the
+    highlighter and symbol table only revisit those blocks. The editor is
+    read-only meanwhile; its cursor and scroll position are left alone.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int)
+
+    slice_seconds = 0.008
+
+    def __init__(self, editor, plan):
+        super().__init__(editor)
+        self.editor = editor
+        self.starts, self.ends, self.first_lines, self.last_lines, self.replacements = plan
+        self._next = len(self.starts) - 1
+        self._done = 0
+        self._cursor = None
+        self._scroll = (0, 0)
+        self._read_only = False
+        self._running = False
+
+    def start(self):
+        editor = self.editor
+        self._running = True
+        self._read_only = editor.isReadOnly()
+        editor.setReadOnly(True)
+        self._scroll = (editor.verticalScrollBar().value(), editor.horizontalScrollBar().value())
+        self._cursor = QTextCursor(editor.document())
+        self._apply_slice()
+
+    def is_running(self):
+        return self._running
 
-try:
-    import jedi
-    HAS_JEDI = True
-except ImportError:
-    HAS_JEDI = False
+    def cancel(self):
+        # What was replaced so far stays, as a single undo step.
+        if self._running:
+            self._finish()
 
-from highlighter import PythonHighlighter
+    def _apply_slice(self):
+        if not self._running:
+            return
+        deadline = time.perf_counter() + self.slice_seconds
+        cursor = self._cursor
+        index = self._next
+        while index >= 0 and time.perf_counter() < deadline:
+            if index == len(self.starts) - 1:
+                cursor.beginEditBlock()
+            else:
+                cursor.joinPreviousEditBlock()
+            while True:
+                cursor.setPosition(self.starts[index])
+                cursor.setPosition(self.ends[index], QTextCursor.KeepAnchor)
+                cursor.insertText(self.replacements[index])
+                index -= 1
+                if index < 0 or self.last_lines[index] < self.first_lines[index + 1] - 1 \
+                        or time.perf_counter() >= deadline:
+                    break
+            cursor.endEditBlock()
+        self._next = index
+        self._done = len(self.starts) - index - 1
+        self._restore_scroll()
+        self.progress.emit(self._done, len(self.starts))
+        if index >= 0:
+            QTimer.singleShot(0, self._apply_slice)
+        else:
+            self._finish()
+
+    def _restore_scroll(self):
+        self.editor.verticalScrollBar().setValue(self._scroll[0])
+        self.editor.horizontalScrollBar().setValue(self._scroll[1])
+
+    def _finish(self):
+        self._running = False
+        self.editor.setReadOnly(self._read_only)
+        self.editor.highlight_current_line()
+        self._restore_scroll()
+        self.finished.emit(self._done)
 
 
 class LineNumberArea(QWidget):
@@ -26,30 +178,96 @@ class LineNumberArea(QWidget):
 
 
 class CodeEditor(QPlainTextEdit):
+    # Seconds the last accepted completion took and whether it was the
+    # first one for the workspace.
+    completion_timed = pyqtSignal(float, bool)
+    # Go to definition and find references; the window shows the results.
+    definitions_found = pyqtSignal(str, object)
+    references_started = pyqtSignal(str)
+    references_found = pyqtSignal(object)
+    references_finished = pyqtSignal(int, str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.setFont(QFont("Consolas", 12))
         self.highlighter = PythonHighlighter(self.document())
 
+        # Extra selections are kept per kind (current line, bracket match,
+        # find results, ...) and combined in insertion order.
+        self._extra_selections = {}
+
         # Line number area
         self.lineNumberArea = LineNumberArea(self)
         self.blockCountChanged.connect(self.update_line_number_area_width)
         self.updateRequest.connect(self.update_line_number_area)
         self.cursorPositionChanged.connect(self.highlight_current_line)
+        self.verticalScrollBar().valueChanged.connect(self.on_viewport_moved)
         self.update_line_number_area_width(0)
         self.highlight_current_line()
 
+        # Bracket matching runs once the edit that moved the cursor has been
+        # highlighted and the bracket index is up to date.
+        self._bracket_timer = QTimer(self)
+        self._bracket_timer.setSingleShot(True)
+        self._bracket_timer.setInterval(0)
+        self._bracket_timer.timeout.connect(self.highlight_matching_brackets)
+        self.cursorPositionChanged.connect(self._bracket_timer.start)
+
         # Autocomplete
+        # The model ranks candidates itself (fuzzy, top-K), so the completer
+        # shows its rows unfiltered.
+        self.completion_model = FuzzyCompletionModel(parent=self)
         self.completer = QCompleter()
-        self.completer.setModel(QStringListModel())
+        self.completer.setModel(self.completion_model)
         self.completer.setWidget(self)
-        self.completer.setCompletionMode(QCompleter.PopupCompletion)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)
         self.completer.activated.connect(self.insert_completion)
         self.setup_completer_style()
 
         self.use_jedi = HAS_JEDI
+        self.file_path = None
+
+        # The language server gets every edit as a range of replaced blocks.
+        self.document_uri = None
+        if HAS_JEDI:
+            self.document_uri = f"editor:{id(self)}"
+            language_client().open_document(self.document_uri, self.toPlainText())
+            self.destroyed.connect(
+                lambda _=None, uri=self.document_uri: language_client().close_document(uri))
+
+        # Fallback candidates, updated only for the blocks each edit touches.
+        self.symbols = SymbolTable()
+        self._candidates_key = None
+        self.document().contentsChange.connect(self._update_symbols)
+        # document().revision() also moves when the highlighter restyles a
+        # block, so completions track their own count of text edits.
+        self.text_revision = 0
+        self.document().contentsChange.connect(self._on_text_edited)
+
+        # Completions are asked of the language server a moment after typing
+        # pauses. Each request gets a new id; results for an older id, or for
+        # a document or cursor that moved on since, are dropped.
+        self.completion_delay = 150
+        self._completion_id = 0
+        self._completion_snapshot = None
+        self._completion_identifier = None
+        self.completion_cache = CompletionSessionCache()
+        self._completion_request = None
+        self._completion_connected = False
+        self._completion_timer = QTimer(self)
+        self._completion_timer.setSingleShot(True)
+        self._completion_timer.timeout.connect(self.request_completions)
+
+        # Start of the key press the pending popup is for, see latency.py.
+        self._key_time = None
+        self._completion_sent = 0.0
+
+        self._navigation_ids = {'definition': 0, 'references': 0}
+        self._navigation_connected = False
+        self._references_request = None
+        self._references_count = 0
 
     # ------------------------
     # Line number methods
@@ -74,6 +292,7 @@ class CodeEditor(QPlainTextEdit):
         super().resizeEvent(event)
         cr = self.contentsRect()
         self.lineNumberArea.setGeometry(QRect(cr.left(), cr.top(), self.line_number_area_width(), cr.height()))
+        self.on_viewport_moved()
 
     def line_number_area_paint_event(self, event):
         painter = QPainter(self.lineNumberArea)
@@ -104,7 +323,189 @@ class CodeEditor(QPlainTextEdit):
         selection.format.setProperty(QTextFormat.FullWidthSelection, True)
         selection.cursor = self.textCursor()
         selection.cursor.clearSelection()
-        self.setExtraSelections([selection])
+        self.set_extra_selections('current_line', [selection])
+
+    def set_extra_selections(self, kind, selections):
+        self._extra_selections[kind] = selections
+        combined = []
+        for items in self._extra_selections.values():
+            combined.extend(items)
+        self.setExtraSelections(combined)
+
+    # ------------------------
+    # Bracket matching
+    # ------------------------
+    def bracket_pair_at_cursor(self):
+        """Return ((block, column), (block, column) or None) for the bracket
+        at or just before the cursor, or None when there is none."""
+        cursor = self.textCursor()
+        number = cursor.blockNumber()
+        column = cursor.positionInBlock()
+        brackets = self.highlighter.brackets
+        for col in (column, column - 1):
+            if col >= 0 and brackets.bracket_at(number, col) is not None:
+                return (number, col), brackets.match(number, col)
+        return None
+
+    def _bracket_selection(self, number, column, color):
+        selection = QTextEdit.ExtraSelection()
+        selection.format.setBackground(QColor(color))
+        cursor = QTextCursor(self.document().findBlockByNumber(number))
+        cursor.movePosition(QTextCursor.Right, QTextCursor.MoveAnchor, column)
+        cursor.movePosition(QTextCursor.Right, QTextCursor.KeepAnchor)
+        selection.cursor = cursor
+        return selection
+
+    def highlight_matching_brackets(self):
+        selections = []
+        pair = self.bracket_pair_at_cursor()
+        if pair is not None:
+            (number, column), partner = pair
+            brackets = self.highlighter.brackets
+            if partner is not None and \
+                    BRACKET_PAIRS[brackets.bracket_at(number, column)] == brackets.bracket_at(*partner):
+                selections.append(self._bracket_selection(number, column, "#c8e6c9"))
+                selections.append(self._bracket_selection(*partner, "#c8e6c9"))
+            else:
+                selections.append(self._bracket_selection(number, column, "#ffcdd2"))
+                if partner is not None:
+                    selections.append(self._bracket_selection(*partner, "#ffcdd2"))
+        self.set_extra_selections('brackets', selections)
+
+    def go_to_line(self, line, column=0):
+        block = self.document().findBlockByNumber(max(0, line - 1))
+        if not block.isValid():
+            block = self.document().lastBlock()
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.Right, QTextCursor.MoveAnchor, min(column, block.length() - 1))
+        self.setTextCursor(cursor)
+        self.centerCursor()
+        self.setFocus()
+
+    # ------------------------
+    # Navigation
+    # ------------------------
+    def _navigation_request(self, kind, method):
+        name = self.textUnderCursor()
+        if not self.use_jedi or not name.isidentifier():
+            return None
+        client = language_client()
+        if not self._navigation_connected:
+            client.finished.connect(self._on_navigation_result)
+            client.failed.connect(self._on_navigation_failed)
+            client.partial.connect(self._on_references_partial)
+            self._navigation_connected = True
+        cursor = self.textCursor()
+        self._navigation_ids[kind] += 1
+        return name, client.request(
+            (self, kind, self._navigation_ids[kind], name), method,
+            {'uri': self.document_uri, 'path': self.file_path,
+             'line': cursor.blockNumber() + 1, 'column': cursor.positionInBlock()})
+
+    def go_to_definition(self):
+        if self._navigation_request('definition', 'textDocument/definition') is not None:
+            return True
+        name = self.textUnderCursor()
+        if not name.isidentifier():
+            return False
+        self.definitions_found.emit(name, self._index_definitions(name))
+        return True
+
+    def _index_definitions(self, name):
+        # Fallback when the language server has no answer: the workspace
+        # index knows the definitions in every file of the folder.
+        index = language_client().workspace_index
+        if index is None or not index.is_open():
+            return []
+        return [{
+            'name': found,
+            'type': kind,
+            'path': path,
+            'line': line,
+            'column': column,
+            'description': f"{kind} {container + '.' if container else ''}{found}",
+            'text': '',
+            'current': path == self.file_path,
+        } for found, kind, path, line, column, container in index.definitions(name) if found == name]
+
+    def find_references(self):
+        self.cancel_references()
+        request = self._navigation_request('references', 'textDocument/references')
+        if request is None:
+            return False
+        self._references_request = request[1]
+        self._references_count = 0
+        self.references_started.emit(request[0])
+        return True
+
+    def cancel_references(self, message="Search stopped"):
+        if self._references_request is not None:
+            language_client().cancel(self._references_request)
+            self._references_request = None
+            self.references_finished.emit(self._references_count, message)
+
+    def _is_navigation_key(self, key):
+        return isinstance(key, tuple) and len(key) == 4 and key[0] is self \
+            and key[2] == self._navigation_ids[key[1]]
+
+    def _on_navigation_result(self, key, result):
+        if not self._is_navigation_key(key):
+            return
+        if key[1] == 'definition':
+            self.definitions_found.emit(key[3], result or self._index_definitions(key[3]))
+        else:
+            self._references_request = None
+            self.references_finished.emit(result['count'], "")
+
+    def _on_navigation_failed(self, key, error):
+        if not self._is_navigation_key(key):
+            return
+        if key[1] == 'definition':
+            self.definitions_found.emit(key[3], self._index_definitions(key[3]))
+        else:
+            self._references_request = None
+            self.references_finished.emit(self._references_count, str(error))
+
+    def _on_references_partial(self, key, items):
+        if self._is_navigation_key(key) and key[1] == 'references':
+            self._references_count += len(items)
+            self.references_found.emit(items)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ControlModifier \
+                and not self.textCursor().hasSelection():
+            self.go_to_definition()
+
+    def jump_to_matching_bracket(self):
+        pair = self.bracket_pair_at_cursor()
+        if pair is None or pair[1] is None:
+            return False
+        (_, column), (number, partner_column) = pair
+        # Keep the cursor on the same side of the bracket it started on.
+        after = column < self.textCursor().positionInBlock()
+        cursor = QTextCursor(self.document().findBlockByNumber(number))
+        cursor.movePosition(QTextCursor.Right, QTextCursor.MoveAnchor, partner_column + after)
+        self.setTextCursor(cursor)
+        return True
+
+    # ------------------------
+    # Lazy highlighting
+    # ------------------------
+    def setPlainText(self, text):
+        lazy = self.highlighter.begin_lazy_load(text)
+        super().setPlainText(text)
+        if lazy:
+            self.highlighter.end_lazy_load(*self.visible_block_range())
+
+    def visible_block_range(self):
+        first = self.firstVisibleBlock().blockNumber()
+        line_height = max(1, self.fontMetrics().height())
+        return first, first + self.viewport().height() // line_height + 1
+
+    def on_viewport_moved(self, *_):
+        if self.highlighter.is_lazy_pending():
+            self.highlighter.prioritize_blocks(*self.visible_block_range())
 
     # ------------------------
     # Autocomplete methods
@@ -171,44 +572,172 @@ class CodeEditor(QPlainTextEdit):
         tc.movePosition(QTextCursor.Left, QTextCursor.KeepAnchor, extra)
         tc.insertText(completion)
         self.setTextCursor(tc)
+        completion_matcher.record_use(completion)
 
     def textUnderCursor(self):
         tc = self.textCursor()
         tc.select(QTextCursor.WordUnderCursor)
         return tc.selectedText()
 
+    def _update_symbols(self, position, chars_removed, chars_added):
+        first, removed, added = edited_blocks(self.document(), position, chars_added, len(self.symbols))
+        texts = []
+        block = self.document().findBlockByNumber(first)
+        for _ in range(added):
+            texts.append(block.text())
+            block = block.next()
+        self.symbols.replace(first, removed, texts)
+        if self.document_uri is not None:
+            language_client().change_document(self.document_uri, first, removed, texts)
+
+    def _on_text_edited(self, position, chars_removed, chars_added):
+        self.text_revision += 1
+        if chars_removed or chars_added:
+            # Positions found so far no longer match the text.
+            self.cancel_references("Search stopped: text changed")
+        self.completion_cache.edit(position, chars_removed, chars_added, self.text_revision)
+
     def update_completions(self):
-        code = self.toPlainText()
-        suggestions = set(keyword.kwlist + [
-            'print', 'input', 'len', 'open', 'range', 'str', 'int', 'float',
-            'list', 'dict', 'set', 'type', 'isinstance', 'super', 'dir'
-        ])
-        suggestions.update(re.findall(r'\b([a-zA-Z_][a-zA-Z0-9_]*)\s*=', code))
-        suggestions.update(re.findall(r'def\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*\(', code))
-        suggestions.update(re.findall(r'class\s+([a-zA-Z_][a-zA-Z0-9_]*)\s*[:\(]', code))
-        suggestions.update(re.findall(r'import\s+([a-zA-Z0-9_\.]+)', code))
-        suggestions = sorted([s for s in suggestions if s])
-        self.completer.model().setStringList(suggestions)
-
-    def update_completions_with_jedi(self):
-        try:
-            code = self.toPlainText()
-            line = self.textCursor().blockNumber() + 1
-            col = self.textCursor().positionInBlock()
-            script = jedi.Script(code=code, path='editor.py')
-            completions = script.complete(line=line, column=col)
-            suggestions = sorted(set(comp.name for comp in completions if comp.name))
-            if not suggestions:
-                self.update_completions()
-            else:
-                self.completer.model().setStringList(suggestions)
-        except Exception:
+        # The model is only reset when the candidates actually changed.
+        prefix = self.completion_prefix_at_cursor()
+        workspace_names = language_client().workspace_completions(prefix) if prefix else ()
+        key = (self.symbols.version, workspace_names)
+        if self._candidates_key != key:
+            candidates = self.symbols.candidates()
+            if workspace_names:
+                candidates = sorted(set(candidates).union(workspace_names))
+            self.completion_model.set_candidates(candidates)
+            self._candidates_key = key
+
+    def _completion_state(self):
+        return self.text_revision, self.textCursor().position()
+
+    def schedule_completions(self):
+        self._completion_timer.start(self.completion_delay)
+
+    def cancel_completions(self):
+        self._completion_timer.stop()
+        self._completion_id += 1
+        self._completion_snapshot = None
+        if self._completion_request is not None:
+            language_client().cancel(self._completion_request)
+            self._completion_request = None
+
+    def request_completions(self):
+        self.cancel_completions()
+        if not self.use_jedi:
             self.update_completions()
+            self.show_completion_popup()
+            return
+        identifier = self.identifier_at_cursor()
+        cursor = self.textCursor()
+        client = language_client()
+        if not self._completion_connected:
+            client.finished.connect(self._on_completions)
+            client.failed.connect(self._on_completions_failed)
+            self._completion_connected = True
+        self._completion_snapshot = self._completion_state()
+        self._completion_identifier = identifier
+        self._completion_sent = time.perf_counter()
+        self._completion_request = client.request(
+            (self, self._completion_id), 'textDocument/completion',
+            {'uri': self.document_uri, 'path': self.file_path,
+             'line': cursor.blockNumber() + 1, 'column': cursor.positionInBlock()})
+
+    def _on_completions(self, key, result):
+        if not isinstance(key, tuple) or key[0] is not self or key[1] != self._completion_id:
+            return
+        self._completion_request = None
+        if self._completion_snapshot != self._completion_state():
+            return
+        suggestions = result['suggestions']
+        latency_recorder.record('completion_round_trip', time.perf_counter() - self._completion_sent)
+        latency_recorder.record('completion_server', result['elapsed'])
+        language_client().completion_stats = result['stats']
+        self.completion_timed.emit(result['elapsed'], result['cold'])
+        if suggestions is None:
+            self.update_completions()
+        else:
+            if self._completion_identifier is not None:
+                start, end, prefix = self._completion_identifier
+                self.completion_cache.store(self._completion_snapshot[0], start, end, prefix, suggestions)
+            self.completion_model.set_candidates(suggestions)
+            self._candidates_key = None
+        self.show_completion_popup()
+
+    def _on_completions_failed(self, key, error):
+        # The server restarted or gave up: offer the document's own names.
+        if not isinstance(key, tuple) or key[0] is not self or key[1] != self._completion_id:
+            return
+        self._completion_request = None
+        if self._completion_snapshot != self._completion_state():
+            return
+        self.update_completions()
+        self.show_completion_popup()
+
+    def identifier_at_cursor(self):
+        tc = self.textCursor()
+        tc.select(QTextCursor.WordUnderCursor)
+        prefix = tc.selectedText()
+        if len(prefix) >= 1 and (prefix.isalnum() or '_' in prefix):
+            return tc.selectionStart(), tc.selectionEnd(), prefix
+        return None
+
+    def complete_from_cache(self, identifier):
+        start, _, prefix = identifier
+        suggestions = self.completion_cache.lookup(self.text_revision, start, prefix)
+        if suggestions is None:
+            return False
+        self.completion_model.set_candidates(suggestions)
+        self._candidates_key = None
+        self.show_completion_popup()
+        return True
+
+    def completion_prefix_at_cursor(self):
+        identifier = self.identifier_at_cursor()
+        return identifier[2] if identifier is not None else None
+
+    def show_completion_popup(self):
+        prefix = self.completion_prefix_at_cursor()
+        if prefix is None:
+            self.completer.popup().hide()
+            return
+        start = time.perf_counter()
+        self.completion_model.set_query(prefix)
+        self.completer.setCompletionPrefix(prefix)
+        ranked = time.perf_counter()
+        latency_recorder.record('completion_ranking', ranked - start)
+        if self.completion_model.rowCount() == 0:
+            self.completer.popup().hide()
+            return
+        rect = self.cursorRect()
+        rect.setWidth(
+            self.completer.popup().sizeHintForColumn(0) +
+            self.completer.popup().verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
+        self.completer.popup().setCurrentIndex(self.completion_model.index(0))
+        shown = time.perf_counter()
+        latency_recorder.record('popup_layout', shown - ranked)
+        if self._key_time is not None:
+            latency_recorder.record('keystroke_to_popup', shown - self._key_time)
+            self._key_time = None
 
     # ------------------------
     # Key press handling
     # ------------------------
     def keyPressEvent(self, event):
+        start = time.perf_counter()
+        self.highlighter.edit_time = 0.0
+        self._key_time = start
+        self._handle_key_press(event)
+        elapsed = time.perf_counter() - start
+        highlight = self.highlighter.edit_time
+        latency_recorder.record('keystroke', elapsed)
+        latency_recorder.record('key_handling', elapsed - highlight)
+        if highlight:
+            latency_recorder.record('highlight', highlight)
+
+    def _handle_key_press(self, event):
         if self.completer.popup().isVisible():
             if event.key() in (Qt.Key_Enter, Qt.Key_Return, Qt.Key_Tab):
                 event.ignore()
@@ -231,20 +760,16 @@ class CodeEditor(QPlainTextEdit):
 
         super().keyPressEvent(event)
 
-        tc = self.textCursor()
-        tc.select(QTextCursor.WordUnderCursor)
-        completion_prefix = tc.selectedText()
-
-        if len(completion_prefix) >= 1 and (completion_prefix.isalnum() or '_' in completion_prefix):
-            if self.use_jedi:
-                self.update_completions_with_jedi()
-            else:
-                self.update_completions()
-            self.completer.setCompletionPrefix(completion_prefix)
-            rect = self.cursorRect()
-            rect.setWidth(
-                self.completer.popup().sizeHintForColumn(0) +
-                self.completer.popup().verticalScrollBar().sizeHint().width())
-            self.completer.complete(rect)
+        identifier = self.identifier_at_cursor()
+        if identifier is not None:
+            if self.use_jedi and self.complete_from_cache(identifier):
+                self.cancel_completions()
+                return
+            # Narrow the suggestions already shown while fresh ones are computed.
+            if self.completer.popup().isVisible():
+                self.show_completion_popup()
+            self.schedule_completions()
         else:
+            self.cancel_completions()
             self.completer.popup().hide()
+            self._key_time = None
@@ -1,9 +1,325 @@
+from PyQt5.QtCore import pyqtSignal, QCoreApplication, QTimer
 from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
 import keyword
 import re
+import time
+import tokenize
+
+from brackets import BracketIndex
+from semantic import (
+    SEMANTIC_KINDS, analyze_in_process, content_key, semantic_cache, shutdown_analysis_pool,
+)
+from workers import TaskRunner
+
+# 'regex' runs one re.finditer per known word (the original implementation),
+# 'scanner' classifies every identifier of a block in a single pass and
+# 'tokenize' applies spans lexed by the stdlib tokenizer on a worker thread,
+# falling back to the scanner for blocks whose spans are not ready yet.
+ENGINES = ('regex', 'scanner', 'tokenize')
+DEFAULT_ENGINE = 'scanner'
+
+_IDENTIFIER_RE = re.compile(r'\w+')
+
+# Everything outside a string that the string pass cares about: string
+# openers with their prefix, the start of a comment and brackets.
+_CODE_TOKEN_RE = re.compile(
+    r"(?:(?<!\w)(?P<prefix>[rRbBuUfF]{1,2}))?(?P<quote>'''|\"\"\"|'|\")"
+    r"|(?P<comment>#)|(?P<open>[(\[{])|(?P<close>[)\]}])"
+)
+
+# Match from inside a string up to and including its closing delimiter.
+_STRING_END_RES = {
+    "'''": re.compile(r"(?:[^'\\]|\\.|'(?!''))*'''"),
+    '"""': re.compile(r'(?:[^"\\]|\\.|"(?!""))*"""'),
+    "'": re.compile(r"(?:[^'\\]|\\.)*'"),
+    '"': re.compile(r'(?:[^"\\]|\\.)*"'),
+}
+
+# Block states pack the string left open at the end of the line (an index
+# into STRING_QUOTES), its raw/f prefix flags and the bracket depth carried
+# into the next line. Equal states mean the next block needs no rehighlight.
+STRING_QUOTES = (None, "'''", '"""', "'", '"')
+_QUOTE_MASK = 0x7
+_RAW_FLAG = 0x8
+_F_FLAG = 0x10
+_DEPTH_SHIFT = 5
+_MAX_DEPTH = 0xFFFF
+
+
+def encode_block_state(quote=None, raw=False, fstring=False, depth=0):
+    state = STRING_QUOTES.index(quote)
+    if raw:
+        state |= _RAW_FLAG
+    if fstring:
+        state |= _F_FLAG
+    return state | min(depth, _MAX_DEPTH) << _DEPTH_SHIFT
+
+
+def decode_block_state(state):
+    if state < 0:
+        return None, False, False, 0
+    return (STRING_QUOTES[state & _QUOTE_MASK], bool(state & _RAW_FLAG),
+            bool(state & _F_FLAG), state >> _DEPTH_SHIFT)
+
+
+# ------------------------
+# Background lexing for the 'tokenize' engine
+# ------------------------
+# Spans are stored per line as flat array('I') triples of
+# (column, length, index into TOKEN_FORMATS).
+TOKEN_FORMATS = (
+    'keyword', 'builtin', 'constant', 'exception', 'magic', 'string', 'comment',
+    'number', 'decorator', 'operator', 'bracket_round', 'bracket_curly',
+    'bracket_square', 'class_name', 'function_name', 'self', 'docstring', 'f_string',
+)
+_TOKEN_FORMAT_INDEX = {name: i for i, name in enumerate(TOKEN_FORMATS)}
+_BRACKET_FORMATS = {
+    '(': 'bracket_round', ')': 'bracket_round',
+    '{': 'bracket_curly', '}': 'bracket_curly',
+    '[': 'bracket_square', ']': 'bracket_square',
+}
+_OPERATOR_CHARS = frozenset('+-*/%=<>!&|^~')
+_STRING_PREFIX_RE = re.compile(r'[rRbBuUfF]*')
+_LINE_STARTS = frozenset((tokenize.NEWLINE, tokenize.NL, tokenize.INDENT, tokenize.DEDENT))
+_FSTRING_START = getattr(tokenize, 'FSTRING_START', None)
+_FSTRING_END = getattr(tokenize, 'FSTRING_END', None)
+
+
+def lex_lines(lines, start, first_dirty, reusable, word_formats, is_current=None):
+    """Tokenize lines[start:] and return one (spans, exit_state) per line.
+
+    start must be a line that begins outside any string or bracket. Lexing
+    stops at the first such line after first_dirty whose old result is
+    marked in reusable, or returns None once is_current() turns false.
+    """
+    offsets, spans, string_states, depths = [], [], {}, {}
+
+    def readline():
+        index = start + len(offsets)
+        if index >= len(lines):
+            return ''
+        line = lines[index]
+        stripped = line.lstrip(' \t\f')
+        offsets.append(len(line) - len(stripped))
+        spans.append(array('I'))
+        return stripped + '\n'
+
+    def add(row, col, length, fmt):
+        if length > 0:
+            spans[row].extend((col, length, _TOKEN_FORMAT_INDEX[fmt]))
+
+    def add_string(srow, scol, erow, ecol, text):
+        prefix = _STRING_PREFIX_RE.match(text).group().lower()
+        quote = text[len(prefix):len(prefix) + 3]
+        if quote not in ("\'\'\'", '"""'):
+            quote = quote[:1]
+        if len(quote) == 3:
+            fmt = 'docstring'
+        elif 'f' in prefix:
+            fmt = 'f_string'
+        else:
+            fmt = 'string'
+        state = encode_block_state(quote, 'r' in prefix, 'f' in prefix)
+        for row in range(srow, erow + 1):
+            line_length = len(lines[start + row])
+            first = scol + offsets[row] if row == srow else 0
+            last = ecol + offsets[row] if row == erow else line_length
+            add(row, first, min(last, line_length) - first, fmt)
+            if row != erow:
+                string_states[row] = state
+
+    depth = 0
+    previous = None
+    decorator = False
+    fstring_start = None
+    stop = None
+    try:
+        for tok in tokenize.generate_tokens(readline):
+            kind, value = tok.type, tok.string
+            srow, scol = tok.start[0] - 1, tok.start[1]
+            erow, ecol = tok.end[0] - 1, tok.end[1]
+            if srow >= len(spans):
+                break
+            col = scol + offsets[srow]
+
+            if fstring_start is not None:
+                if kind == _FSTRING_END:
+                    frow, fcol, ftext = fstring_start
+                    add_string(frow, fcol, erow, ecol, ftext)
+                    fstring_start = None
+                continue
+            if kind == _FSTRING_START:
+                fstring_start = (srow, scol, value + '"')
+                continue
+
+            if kind in (tokenize.NEWLINE, tokenize.NL):
+                decorator = False
+                row = srow + 1
+                if is_current is not None and row % 256 == 0 and not is_current():
+                    return None
+                if depth == 0 and start + row > first_dirty and start + row < len(reusable) \
+                        and reusable[start + row]:
+                    stop = row
+                    break
+            elif kind == tokenize.NAME:
+                fmt = word_formats.get(value)
+                if value in ('self', 'cls'):
+                    fmt = 'self'
+                elif previous == 'class' and value[:1].isupper():
+                    fmt = 'class_name'
+                elif previous == 'def':
+                    fmt = 'function_name'
+                elif decorator and fmt is None:
+                    fmt = 'decorator'
+                if fmt is not None:
+                    add(srow, col, ecol - scol, fmt)
+            elif kind == tokenize.OP:
+                if value in _BRACKET_FORMATS:
+                    # A decorator's call arguments are ordinary code.
+                    decorator = False
+                    add(srow, col, 1, _BRACKET_FORMATS[value])
+                    depth = depth + 1 if value in '([{' else max(depth - 1, 0)
+                    depths[srow] = depth
+                elif value == '@' and (previous is None or previous in _LINE_STARTS):
+                    decorator = True
+                    add(srow, col, 1, 'decorator')
+                elif value == '.' and decorator:
+                    add(srow, col, 1, 'decorator')
+                elif _OPERATOR_CHARS.issuperset(value):
+                    add(srow, col, len(value), 'operator')
+                else:
+                    decorator = False
+            elif kind == tokenize.NUMBER:
+                add(srow, col, ecol - scol, 'number')
+            elif kind == tokenize.STRING:
+                add_string(srow, scol, erow, ecol, value)
+            elif kind == tokenize.COMMENT:
+                add(srow, col, ecol - scol, 'comment')
+            elif kind == tokenize.ERRORTOKEN and value in ('"', "'"):
+                # Unterminated single-line string: color it to the line end.
+                add(srow, col, len(lines[start + srow]) - col, 'string')
+
+            if kind in _LINE_STARTS:
+                previous = kind
+            elif kind not in (tokenize.COMMENT, tokenize.ENDMARKER):
+                previous = value
+    except tokenize.TokenError as error:
+        message, position = error.args
+        if 'string' in message:
+            srow, scol = position[0] - 1, position[1]
+            last = len(spans) - 1
+            add_string(srow, scol, last, len(lines[start + last]) - offsets[last],
+                       lines[start + srow][scol + offsets[srow]:])
+            string_states[last] = string_states.get(srow)
+
+    rows = len(spans) if stop is None else stop
+    result = []
+    depth = 0
+    for row in range(rows):
+        depth = depths.get(row, depth)
+        state = string_states.get(row)
+        if state is None:
+            state = encode_block_state(depth=depth)
+        else:
+            state |= min(depth, _MAX_DEPTH) << _DEPTH_SHIFT
+        result.append((spans[row], state))
+    return result
+
+
+def edited_blocks(document, position, chars_added, old_count):
+    """Return (first block, blocks replaced, blocks now there) for an edit.
+
+    Call it from a contentsChange slot: the document already holds the new
+    text and old_count is the block count it had before the edit.
+    """
+    first = document.findBlock(position).blockNumber()
+    last = document.findBlock(position + chars_added).blockNumber()
+    if first < 0:
+        first = document.blockCount() - 1
+    if last < first:
+        last = document.blockCount() - 1
+    added = last - first + 1
+    return first, added - (document.blockCount() - old_count), added
+
+
+class HighlightCache:
+    """LRU of highlight results shared by every PythonHighlighter.
+
+    Keyed by (block text, previous block state); each entry holds the format
+    runs in the order they were applied, as array('I') triples of
+    (start, length, index into TOKEN_FORMATS), the block's exit state and
+    its (bracket columns, bracket characters).
+    """
+
+    def __init__(self, max_entries=20000, max_line_length=500):
+        self.max_entries = max_entries
+        self.max_line_length = max_line_length
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, text, state):
+        entry = self._entries.get((text, state))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((text, state))
+        self.hits += 1
+        return entry
+
+    def put(self, text, state, runs, exit_state, brackets=((), '')):
+        if len(text) > self.max_line_length:
+            return
+        self._entries[(text, state)] = (runs, exit_state, brackets)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+highlight_cache = HighlightCache()
+
+_lex_runner = None
+_semantic_runner = None
+
+
+def _shared_lex_runner():
+    global _lex_runner
+    if _lex_runner is None:
+        _lex_runner = TaskRunner('highlighter-lexer')
+    return _lex_runner
+
+
+def _shared_semantic_runner():
+    global _semantic_runner
+    if _semantic_runner is None:
+        _semantic_runner = TaskRunner('highlighter-semantic')
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(shutdown_analysis_pool)
+    return _semantic_runner
+
 
 class PythonHighlighter(QSyntaxHighlighter):
-    def __init__(self, document):
+    # Number of blocks the last edit caused highlightBlock to run on.
+    edit_rehighlighted = pyqtSignal(int)
+
+    def __init__(self, document, engine=DEFAULT_ENGINE, lazy=True, semantic=True):
         super().__init__(document)
 
         self.python_keywords = keyword.kwlist
@@ -79,9 +395,126 @@ class PythonHighlighter(QSyntaxHighlighter):
             'self': self._create_format(QColor("#2FAAED")),
             'docstring': self._create_format(QColor("#62A443")),
             'f_string': self._create_format(QColor("#528839")),
+            'parameter': self._create_format(QColor("#A0601C"), italic=True),
+            'local': self._create_format(QColor("#3B3B3B")),
+            'global': self._create_format(QColor("#8E3A59")),
+            'imported': self._create_format(QColor("#0F8B8D")),
+            'attribute': self._create_format(QColor("#5468A8")),
         }
 
         self._excluded_ranges = []
+        self._excluded_starts = array('i')
+        self._excluded_ends = array('i')
+        self._comment_start = -1
+
+        self.last_edit_block_count = 0
+        self._block_count = 0
+        self.edit_time = 0.0
+        self._edit_started = 0.0
+
+        # Lazy mode: documents loaded with at least lazy_threshold lines only
+        # get their visible blocks (plus lazy_margin) highlighted right away,
+        # the rest is swept in idle-time slices of lazy_budget seconds.
+        # Blocks that were never highlighted keep Qt's default state of -1.
+        self.lazy = lazy
+        self.lazy_threshold = 5000
+        self.lazy_margin = 100
+        self.lazy_budget = 0.01
+        self.lazy_chunk = 200
+        self._lazy_active = False
+        self._lazy_loading = False
+        self._lazy_frontier = 0
+        self._lazy_next = 0
+        self._lazy_window = (0, -1)
+        self._lazy_priority = None
+        self._lazy_edit = None
+        self._lazy_timer = QTimer(self)
+        self._lazy_timer.setInterval(0)
+        self._lazy_timer.timeout.connect(self._lazy_step)
+
+        # Later lists win, matching the order the regex engine applies them in.
+        self.word_formats = {}
+        for word_list, fmt in self._word_lists():
+            for word in word_list:
+                self.word_formats[word] = fmt
+
+        # 'tokenize' engine: one (text, entry_state, spans, exit_state) entry
+        # per block, or None while the block waits to be (re)lexed.
+        self._token_formats = [self.formats[name] for name in TOKEN_FORMATS]
+        self._format_indexes = {id(fmt): i for i, fmt in enumerate(self._token_formats)}
+        self._runs = None
+        self._token_cache = []
+        self._lex_revision = 0
+        self._lex_applying = False
+        self._lex_reached = -1
+        self._lex_connected = False
+        self._lex_timer = QTimer(self)
+        self._lex_timer.setSingleShot(True)
+        self._lex_timer.setInterval(30)
+        self._lex_timer.timeout.connect(self._request_lex)
+
+        # Semantic pass: analyze() runs in a child process a moment after typing
+        # stops and its per-line spans are laid over the lexical formats.
+        self.semantic = semantic
+        self.semantic_delay = 500
+        self._semantic_formats = [self.formats[kind] for kind in SEMANTIC_KINDS]
+        self._semantic_table = {}
+        self._semantic_key = None
+        self._semantic_pending = None
+        self._semantic_rows = []
+        self._semantic_connected = False
+        self._semantic_timer = QTimer(self)
+        self._semantic_timer.setSingleShot(True)
+        self._semantic_timer.timeout.connect(self._request_semantic)
+        self._semantic_apply_timer = QTimer(self)
+        self._semantic_apply_timer.setInterval(0)
+        self._semantic_apply_timer.timeout.connect(self._semantic_apply_step)
+
+        # Brackets outside strings and comments, collected from the format
+        # runs of every highlighted block.
+        self.brackets = BracketIndex()
+        self._bracket_indexes = frozenset(
+            _TOKEN_FORMAT_INDEX[name] for name in ('bracket_round', 'bracket_curly', 'bracket_square'))
+
+        self.engine = None
+        self.set_engine(engine)
+
+        if document is not None:
+            # Reattach so that _on_contents_changing is connected ahead of
+            # QSyntaxHighlighter's own contentsChange slot and runs before an
+            # edit is rehighlighted, while _on_contents_change runs after it.
+            self.setDocument(None)
+            document.contentsChange.connect(self._on_contents_changing)
+            self.setDocument(document)
+            document.contentsChange.connect(self._on_contents_change)
+            self.brackets.reset(document.blockCount())
+            if self.engine == 'tokenize':
+                self._reset_token_cache()
+
+    def _word_lists(self):
+        return [
+            (self.python_keywords, 'keyword'),
+            (self.builtin_functions, 'builtin'),
+            (self.builtin_constants, 'constant'),
+            (self.builtin_exceptions, 'exception'),
+            (self.magic_methods, 'magic')
+        ]
+
+    def set_engine(self, engine):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown highlighter engine: {engine!r}")
+        if engine == self.engine:
+            return
+        rehighlight = self.engine is not None
+        self.engine = engine
+        if engine == 'regex':
+            self._highlight_words = self._highlight_keywords
+        else:
+            self._highlight_words = self._highlight_identifiers
+        if rehighlight and self.document() is not None:
+            if engine == 'tokenize':
+                self._reset_token_cache()
+            self.rehighlight()
 
     def _create_format(self, color, bold=False, italic=False):
         fmt = QTextCharFormat()
@@ -92,93 +525,431 @@ class PythonHighlighter(QSyntaxHighlighter):
             fmt.setFontItalic(True)
         return fmt
 
-    def highlightBlock(self, text):
+    def _on_contents_changing(self, position, chars_removed, chars_added):
+        self._edit_started = time.perf_counter()
+        if self._lazy_active and not self._lazy_loading:
+            self._lazy_edit = (position, position + chars_added)
+        document = self.document()
+        self.brackets.splice(*edited_blocks(document, position, chars_added, len(self.brackets)))
+        if self.engine == 'tokenize':
+            self._invalidate_tokens(position, chars_added)
+
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        # Seconds spent rehighlighting edits since the editor last reset it.
+        self.edit_time += time.perf_counter() - self._edit_started
+        if self._lazy_active and not self._lazy_loading:
+            self._lazy_edit = None
+            block = self.document().findBlock(position)
+            self._lazy_next = min(self._lazy_next, max(block.blockNumber(), 0))
+        self.last_edit_block_count = self._block_count
+        self._block_count = 0
+        self.edit_rehighlighted.emit(self.last_edit_block_count)
+        if self.semantic:
+            self._semantic_timer.start(self.semantic_delay)
+
+    # ------------------------
+    # Lazy highlighting
+    # ------------------------
+    def begin_lazy_load(self, text):
+        if not self.lazy or text.count('\n') < self.lazy_threshold:
+            self._finish_lazy()
+            return False
+        self._lazy_active = True
+        self._lazy_loading = True
+        self._lazy_frontier = 0
+        self._lazy_next = 0
+        self._lazy_priority = None
+        return True
+
+    def end_lazy_load(self, first, last):
+        self._lazy_loading = False
+        self.highlight_blocks(first, last)
+        self._block_count = 0
+        self._lazy_timer.start()
+
+    def is_lazy_pending(self):
+        return self._lazy_active
+
+    def highlight_blocks(self, first, last):
+        if not self._lazy_active:
+            return
+        first = max(0, first - self.lazy_margin)
+        last = last + self.lazy_margin
+        self._lazy_window = (first, last)
+        try:
+            block = self.document().findBlockByNumber(first)
+            while block.isValid() and block.blockNumber() <= last:
+                if block.userState() == -1:
+                    self.rehighlightBlock(block)
+                block = block.next()
+        finally:
+            self._lazy_window = (0, -1)
+
+    def prioritize_blocks(self, first, last):
+        if self._lazy_active:
+            self._lazy_priority = (first, last)
+            self._lazy_timer.start()
+
+    def _lazy_step(self):
+        if self._lazy_priority is not None:
+            first, last = self._lazy_priority
+            self._lazy_priority = None
+            self.highlight_blocks(first, last)
+
+        deadline = time.perf_counter() + self.lazy_budget
+        block = self.document().findBlockByNumber(self._lazy_next)
+        while block.isValid():
+            if time.perf_counter() >= deadline:
+                self._lazy_next = block.blockNumber()
+                self._block_count = 0
+                return
+            if block.userState() == -1:
+                self._lazy_frontier = block.blockNumber() + self.lazy_chunk
+                self.rehighlightBlock(block)
+            block = block.next()
+        self._block_count = 0
+        self._finish_lazy()
+
+    def _finish_lazy(self):
+        self._lazy_active = False
+        self._lazy_loading = False
+        self._lazy_edit = None
+        self._lazy_priority = None
+        self._lazy_timer.stop()
+
+    # ------------------------
+    # Tokenize engine
+    # ------------------------
+    def _reset_token_cache(self):
+        self._token_cache = [None] * self.document().blockCount()
+        self._lex_revision += 1
+        self._lex_timer.start()
+
+    def _invalidate_tokens(self, position, chars_added):
+        # Runs before the edit is rehighlighted: drop the entries of the
+        # edited blocks so block numbers line up with the document again.
+        first, removed, added = edited_blocks(self.document(), position, chars_added, len(self._token_cache))
+        self._token_cache[first:first + removed] = [None] * added
+        self._lex_revision += 1
+        self._lex_timer.start()
+
+    def _apply_token_spans(self, text):
+        number = self.currentBlock().blockNumber()
+        if self._lex_applying:
+            self._lex_reached = number
+        entry = self._token_cache[number] if number < len(self._token_cache) else None
+        if entry is None:
+            self._lex_timer.start()
+            return False
+        if entry[0] != text:
+            self._token_cache[number] = None
+            self._lex_timer.start()
+            return False
+        if entry[1] != max(self.previousBlockState(), 0):
+            # Lexed for a different context than the previous block has now;
+            # Qt cascades back here once that block settles.
+            return False
+
         self.setFormat(0, len(text), QTextCharFormat())
+        spans, formats = entry[2], self._token_formats
+        for i in range(0, len(spans), 3):
+            self.setFormat(spans[i], spans[i + 1], formats[spans[i + 2]])
+        self.setCurrentBlockState(entry[3])
+        self.brackets.set_block(number, *self._find_brackets(text, spans))
+        return True
+
+    def _request_lex(self):
+        cache = self._token_cache
+        try:
+            first_dirty = cache.index(None)
+        except ValueError:
+            return
+        # Restart from the nearest line that begins outside strings/brackets.
+        start = first_dirty
+        while start > 0 and (cache[start - 1] is None or cache[start - 1][3] != 0):
+            start -= 1
+        reusable = bytearray(len(cache))
+        for row, entry in enumerate(cache):
+            if entry is not None and entry[1] == 0:
+                reusable[row] = 1
+
+        lines = self._block_texts()
+        revision = self._lex_revision
+        runner = _shared_lex_runner()
+        if not self._lex_connected:
+            runner.finished.connect(self._on_lexed)
+            self._lex_connected = True
+        runner.submit((self, revision, start, lines), lex_lines, lines, start, first_dirty,
+                      reusable, dict(self.word_formats), lambda: self._lex_revision == revision)
+
+    def _on_lexed(self, key, rows):
+        if not isinstance(key, tuple) or key[0] is not self:
+            return
+        _, revision, start, lines = key
+        if rows is None or revision != self._lex_revision:
+            return
+        if len(lines) != len(self._token_cache):
+            # The document changed size without a contentsChange to follow
+            # (QTextDocument.setPlainText on a bare document): start over.
+            self._reset_token_cache()
+            return
+
+        entry_state = 0
+        for offset, (spans, exit_state) in enumerate(rows):
+            self._token_cache[start + offset] = (lines[start + offset], entry_state, spans, exit_state)
+            entry_state = exit_state
+
+        # Re-apply the fresh spans to blocks already on display; blocks the
+        # lazy sweep has not reached pick them up when it gets there.
+        self._lex_applying = True
+        self._lex_reached = -1
+        try:
+            end = start + len(rows)
+            block = self.document().findBlockByNumber(start)
+            while block.isValid() and block.blockNumber() < end:
+                if block.blockNumber() > self._lex_reached and block.userState() != -1:
+                    self.rehighlightBlock(block)
+                block = block.next()
+        finally:
+            self._lex_applying = False
+        self._block_count = 0
+        if None in self._token_cache:
+            self._lex_timer.start()
+
+    def _block_texts(self):
+        lines = []
+        block = self.document().begin()
+        while block.isValid():
+            lines.append(block.text())
+            block = block.next()
+        return lines
+
+    # ------------------------
+    # Semantic highlighting
+    # ------------------------
+    def _request_semantic(self):
+        # Much cheaper than joining the block texts of a large file. It spells
+        # no-break spaces as spaces, so lines holding one keep no overlay.
+        source = self.document().toPlainText()
+        key = content_key(source)
+        if key == self._semantic_key:
+            return
+        self._semantic_pending = key
+        table = semantic_cache.get(key)
+        if table is not None:
+            self._set_semantic_table(key, table)
+            return
+        runner = _shared_semantic_runner()
+        if not self._semantic_connected:
+            runner.finished.connect(self._on_analyzed)
+            self._semantic_connected = True
+        runner.submit((self, key), analyze_in_process, source)
+
+    def _on_analyzed(self, key, table):
+        if not isinstance(key, tuple) or key[0] is not self:
+            return
+        semantic_cache.put(key[1], table)
+        if key[1] == self._semantic_pending:
+            self._set_semantic_table(key[1], table)
+
+    def _set_semantic_table(self, key, table):
+        old = self._semantic_table
+        self._semantic_table = table
+        self._semantic_key = key
+        self._semantic_rows = sorted(
+            (row for row in old.keys() | table.keys() if old.get(row) != table.get(row)),
+            reverse=True)
+        self._semantic_apply_timer.start()
+
+    def _semantic_apply_step(self):
+        # Re-apply changed rows in slices; rows the lazy sweep has not
+        # reached get the overlay when they are highlighted.
+        deadline = time.perf_counter() + self.lazy_budget
+        document = self.document()
+        while self._semantic_rows and time.perf_counter() < deadline:
+            block = document.findBlockByNumber(self._semantic_rows.pop())
+            if block.isValid() and block.userState() != -1:
+                self.rehighlightBlock(block)
+        self._block_count = 0
+        if not self._semantic_rows:
+            self._semantic_apply_timer.stop()
+
+    def _apply_semantic(self, text):
+        entry = self._semantic_table.get(self.currentBlock().blockNumber())
+        if entry is None or entry[0] != text:
+            return
+        spans, formats = entry[1], self._semantic_formats
+        for i in range(0, len(spans), 3):
+            super().setFormat(spans[i], spans[i + 1], formats[spans[i + 2]])
+
+    def _defer_block(self):
+        # Blocks that were highlighted before always are, so edits and state
+        # changes still cascade through them; untouched blocks wait for the
+        # sweep unless they are in the requested window or the current edit.
+        if not self._lazy_active or self.currentBlockState() != -1:
+            return False
+        block = self.currentBlock()
+        number = block.blockNumber()
+        if number < self._lazy_frontier:
+            return False
+        first, last = self._lazy_window
+        if first <= number <= last:
+            return False
+        if self._lazy_edit is not None:
+            start, end = self._lazy_edit
+            if block.position() <= end and start < block.position() + block.length():
+                return False
+        return True
+
+    def rehighlight(self):
+        super().rehighlight()
+        self._block_count = 0
+
+    def highlightBlock(self, text):
+        if self._defer_block():
+            return
+        self._block_count += 1
+        if self.engine != 'tokenize' or not self._apply_token_spans(text):
+            self._highlight_lexical(text)
+        if self._semantic_table:
+            self._apply_semantic(text)
+
+    def _highlight_lexical(self, text):
+        entry_state = max(self.previousBlockState(), 0)
+        cached = None
+        if len(text) <= highlight_cache.max_line_length:
+            cached = highlight_cache.get(text, entry_state)
+        if cached is not None:
+            runs, exit_state, brackets = cached
+            formats = self._token_formats
+            for i in range(0, len(runs), 3):
+                super().setFormat(runs[i], runs[i + 1], formats[runs[i + 2]])
+            self.setCurrentBlockState(exit_state)
+            self.brackets.set_block(self.currentBlock().blockNumber(), *brackets)
+            return
+
+        self._runs = array('I')
         self._excluded_ranges = []
         self._highlight_strings(text)
         self._highlight_comments(text)
+        self._index_excluded_ranges()
         self._highlight_numbers(text)
         self._highlight_decorators(text)
-        self._highlight_keywords(text)
+        self._highlight_words(text)
         self._highlight_operators(text)
         self._highlight_brackets(text)
         self._highlight_class_names(text)
         self._highlight_function_names(text)
         self._highlight_self_cls(text)
+        brackets = self._find_brackets(text, self._runs)
+        highlight_cache.put(text, entry_state, self._runs, self.currentBlockState(), brackets)
+        self.brackets.set_block(self.currentBlock().blockNumber(), *brackets)
+        self._runs = None
+
+    def _find_brackets(self, text, runs):
+        indexes = self._bracket_indexes
+        columns = tuple(sorted(runs[3 * i] for i, kind in enumerate(runs[2::3]) if kind in indexes))
+        return columns, ''.join(text[column] for column in columns)
+
+    def setFormat(self, start, count, fmt):
+        super().setFormat(start, count, fmt)
+        if self._runs is not None:
+            self._runs.extend((start, count, self._format_indexes[id(fmt)]))
+
+    def _index_excluded_ranges(self):
+        # Strings and comments may overlap, so merge them into disjoint sorted
+        # intervals that _is_excluded can bisect.
+        starts, ends = array('i'), array('i')
+        for a, b in sorted(self._excluded_ranges):
+            if ends and a <= ends[-1]:
+                if b > ends[-1]:
+                    ends[-1] = b
+            else:
+                starts.append(a)
+                ends.append(b)
+        self._excluded_starts = starts
+        self._excluded_ends = ends
 
     def _is_excluded(self, start):
-        return any(a <= start < b for a, b in self._excluded_ranges)
+        i = bisect_right(self._excluded_starts, start) - 1
+        return i >= 0 and start < self._excluded_ends[i]
 
     def _highlight_keywords(self, text):
-        for keyword_list, fmt in [
-            (self.python_keywords, 'keyword'),
-            (self.builtin_functions, 'builtin'),
-            (self.builtin_constants, 'constant'),
-            (self.builtin_exceptions, 'exception'),
-            (self.magic_methods, 'magic')
-        ]:
+        for keyword_list, fmt in self._word_lists():
             for word in keyword_list:
                 pattern = rf'\b{re.escape(word)}\b'
                 for match in re.finditer(pattern, text):
                     if not self._is_excluded(match.start()):
                         self.setFormat(match.start(), match.end() - match.start(), self.formats[fmt])
 
+    def _highlight_identifiers(self, text):
+        # Every known word is made of \w characters only, so `\bword\b` matches
+        # exactly where a maximal \w+ run equals the word.
+        word_formats = self.word_formats
+        for match in _IDENTIFIER_RE.finditer(text):
+            fmt = word_formats.get(match.group())
+            if fmt is not None and not self._is_excluded(match.start()):
+                self.setFormat(match.start(), match.end() - match.start(), self.formats[fmt])
+
     def _highlight_strings(self, text):
-        self.setCurrentBlockState(0)
-        triple_single, triple_double = "'''", '"""'
-
-        if self.previousBlockState() == 1:
-            end = text.find(triple_single)
-            if end == -1:
-                end = text.find(triple_double)
-            if end == -1:
-                self.setFormat(0, len(text), self.formats['docstring'])
-                self.setCurrentBlockState(1)
-                self._excluded_ranges.append((0, len(text)))
-                return
-            else:
-                self.setFormat(0, end + 3, self.formats['docstring'])
-                self._excluded_ranges.append((0, end + 3))
-                return
+        quote, raw, fstring, depth = decode_block_state(self.previousBlockState())
+        self._comment_start = -1
+        string_start = pos = 0
+        length = len(text)
 
-        for delim in [triple_single, triple_double]:
-            start = text.find(delim)
-            while start >= 0:
-                end = text.find(delim, start + 3)
-                if end == -1:
-                    self.setFormat(start, len(text) - start, self.formats['docstring'])
-                    self.setCurrentBlockState(1)
-                    self._excluded_ranges.append((start, len(text)))
-                    return
-                else:
-                    self.setFormat(start, end - start + 3, self.formats['docstring'])
-                    self._excluded_ranges.append((start, end + 3))
-                    start = text.find(delim, end + 3)
-
-        f_patterns = [
-            r'f"(?:[^"\\]|\\.)*"', r"f'(?:[^'\\]|\\.)*'",
-            r'rf"(?:[^"\\]|\\.)*"', r"rf'(?:[^'\\]|\\.)*'",
-            r'fr"(?:[^"\\]|\\.)*"', r"fr'(?:[^'\\]|\\.)*'"
-        ]
-        patterns = [
-            r'r"(?:[^"\\]|\\.)*"', r"r'(?:[^'\\]|\\.)*'",
-            r'"(?:[^"\\]|\\.)*"', r"'(?:[^'\\]|\\.)*'"
-        ]
+        while True:
+            if quote is not None:
+                match = _STRING_END_RES[quote].match(text, pos)
+                if match is None:
+                    self._format_string(string_start, length, quote, fstring)
+                    # Only triple quotes and backslash-newline carry a string
+                    # into the next line; anything else is left unterminated.
+                    trailing = length - len(text.rstrip('\\'))
+                    if len(quote) != 3 and trailing % 2 == 0:
+                        quote = None
+                    break
+                self._format_string(string_start, match.end(), quote, fstring)
+                pos = match.end()
+                quote = None
+                continue
 
-        for p in f_patterns:
-            for match in re.finditer(p, text):
-                self.setFormat(match.start(), match.end() - match.start(), self.formats['f_string'])
-                self._excluded_ranges.append((match.start(), match.end()))
+            match = _CODE_TOKEN_RE.search(text, pos)
+            if match is None:
+                break
+            kind = match.lastgroup
+            pos = match.end()
+            if kind == 'quote':
+                prefix = (match.group('prefix') or '').lower()
+                quote = match.group('quote')
+                raw, fstring = 'r' in prefix, 'f' in prefix
+                string_start = match.start()
+            elif kind == 'comment':
+                self._comment_start = match.start()
+                break
+            elif kind == 'open':
+                depth += 1
+            elif depth:
+                depth -= 1
 
-        for p in patterns:
-            for match in re.finditer(p, text):
-                self.setFormat(match.start(), match.end() - match.start(), self.formats['string'])
-                self._excluded_ranges.append((match.start(), match.end()))
+        if quote is None:
+            raw = fstring = False
+        self.setCurrentBlockState(encode_block_state(quote, raw, fstring, depth))
+
+    def _format_string(self, start, end, quote, fstring):
+        if len(quote) == 3:
+            fmt = self.formats['docstring']
+        elif fstring:
+            fmt = self.formats['f_string']
+        else:
+            fmt = self.formats['string']
+        self.setFormat(start, end - start, fmt)
+        self._excluded_ranges.append((start, end))
 
     def _highlight_comments(self, text):
-        for match in re.finditer(r'#.*', text):
-            self.setFormat(match.start(), match.end() - match.start(), self.formats['comment'])
-            self._excluded_ranges.append((match.start(), match.end()))
+        if self._comment_start >= 0:
+            start = self._comment_start
+            self.setFormat(start, len(text) - start, self.formats['comment'])
+            self._excluded_ranges.append((start, len(text)))
 
     def _highlight_numbers(self, text):
         patterns = [
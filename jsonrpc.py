@@ -0,0 +1,68 @@
+import json
+
+# Error codes shared by langserver.py and its client.
+PARSE_ERROR = -32700
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+DOCUMENT_OUT_OF_SYNC = -32001
+REQUEST_CANCELLED = -32800
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+    def to_json(self):
+        return {'code': self.code, 'message': self.message}
+
+
+def encode_message(message):
+    """Frame a JSON-RPC message with a Content-Length header, as LSP does."""
+    body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return b'Content-Length: %d\r\n\r\n' % len(body) + body
+
+
+def _content_length(header):
+    for line in header.split(b'\r\n'):
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            return int(value)
+    raise RpcError(PARSE_ERROR, 'missing Content-Length header')
+
+
+class MessageReader:
+    """Split a byte stream into messages; feed() takes whatever arrived."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        messages = []
+        while True:
+            end = self._buffer.find(b'\r\n\r\n')
+            if end < 0:
+                break
+            start = end + 4
+            length = _content_length(bytes(self._buffer[:end]))
+            if len(self._buffer) < start + length:
+                break
+            body = bytes(self._buffer[start:start + length])
+            del self._buffer[:start + length]
+            messages.append(json.loads(body))
+        return messages
+
+
+def read_message(stream):
+    """Read one message from a binary stream; None at end of input."""
+    header = bytearray()
+    while not header.endswith(b'\r\n\r\n'):
+        byte = stream.read(1)
+        if not byte:
+            return None
+        header += byte
+    body = stream.read(_content_length(bytes(header[:-4])))
+    return json.loads(body)
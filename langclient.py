@@ -0,0 +1,287 @@
+from collections import deque
+import atexit
+import os
+import sys
+import time
+
+from PyQt5.QtCore import QObject, QCoreApplication, QProcess, QTimer, pyqtSignal
+
+from completion import HAS_JEDI
+from jsonrpc import DOCUMENT_OUT_OF_SYNC, MessageReader, RpcError, encode_message
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'langserver.py')
+
+
+class LanguageClient(QObject):
+    """Runs langserver.py in a child process and talks to it without blocking.
+
+    request() returns at once; the answer arrives as finished(key, result)
+    or failed(key, error) on the GUI thread, like TaskRunner, after any
+    partial(key, items) a streaming request sends. Open
+    documents are mirrored here, so when the server dies, or takes longer
+    than request_timeout on one request, it is restarted and sent the
+    workspace and every document again. Requests made while it is down
+    wait for the restart, which backs off and gives up after max_restarts
+    crashes within restart_window. Streaming requests may run longer:
+    the server keeps answering others while it works on them.
+    """
+
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object)
+    partial = pyqtSignal(object, object)
+    restarted = pyqtSignal()
+
+    request_timeout = 20.0
+    streaming_methods = {'textDocument/references'}
+    max_restarts = 5
+    restart_window = 60.0
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = None
+        self.workspace_index = None
+        self.completion_stats = {}
+        self._process = None
+        self._reader = MessageReader()
+        self._next_id = 1
+        self._pending = {}
+        # Requests made while the server is down: (id, key, method, params).
+        self._queued = []
+        self._documents = {}
+        self._restarts = deque()
+        self._started = False
+        self._shutting_down = False
+        self._restart_timer = QTimer(self)
+        self._restart_timer.setSingleShot(True)
+        self._restart_timer.timeout.connect(self._restart)
+        self._watchdog = QTimer(self)
+        self._watchdog.setInterval(1000)
+        self._watchdog.timeout.connect(self._check_timeouts)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def is_available(self):
+        # Crashes older than restart_window no longer count, so a server
+        # given up on is tried again once things have been quiet a while.
+        now = time.monotonic()
+        while self._restarts and now - self._restarts[0] > self.restart_window:
+            self._restarts.popleft()
+        return HAS_JEDI and not self._shutting_down and len(self._restarts) < self.max_restarts
+
+    # ------------------------
+    # Process
+    # ------------------------
+    def start(self):
+        if self._process is not None or not self.is_available():
+            return
+        self._started = True
+        self._reader = MessageReader()
+        process = QProcess(self)
+        process.setProgram(sys.executable)
+        process.setArguments([SERVER_SCRIPT])
+        process.readyReadStandardOutput.connect(self._on_output)
+        process.readyReadStandardError.connect(
+            lambda: sys.stderr.write(bytes(process.readAllStandardError()).decode('utf-8', 'replace')))
+        process.finished.connect(lambda *_: self._on_exited(process))
+        process.errorOccurred.connect(
+            lambda error: error == QProcess.FailedToStart and self._on_exited(process))
+        self._process = process
+        process.start()
+        self._send({'jsonrpc': '2.0', 'id': self._take_id(), 'method': 'initialize',
+                    'params': {'folder': self.folder}})
+        for uri, (version, lines) in self._documents.items():
+            self._notify_open(uri, version, lines)
+        queued, self._queued = self._queued, []
+        for request_id, key, method, params in queued:
+            self._send_request(request_id, key, method, params)
+        self._watchdog.start()
+
+    def _on_exited(self, process):
+        if process is not self._process:
+            return
+        self._process = None
+        self._watchdog.stop()
+        process.deleteLater()
+        pending, self._pending = self._pending, {}
+        error = RuntimeError('language server stopped')
+        for key, _, _ in pending.values():
+            if key is not None:
+                # Queued, so slots never run inside request() or cancel().
+                QTimer.singleShot(0, lambda key=key: self.failed.emit(key, error))
+        if self._shutting_down:
+            return
+        self._restarts.append(time.monotonic())
+        self._schedule_restart()
+
+    def _schedule_restart(self):
+        if self.is_available():
+            if not self._restart_timer.isActive():
+                self._restart_timer.start(250 * len(self._restarts))
+        else:
+            self._fail_queued()
+
+    def _restart(self):
+        if self._process is not None:
+            return
+        if not self.is_available():
+            self._fail_queued()
+            return
+        self.start()
+        self.restarted.emit()
+
+    def _fail_queued(self):
+        queued, self._queued = self._queued, []
+        error = RuntimeError('language server unavailable')
+        for _, key, _, _ in queued:
+            QTimer.singleShot(0, lambda key=key: self.failed.emit(key, error))
+
+    def _check_timeouts(self):
+        now = time.monotonic()
+        if self._process is not None and any(
+                now - sent > self.request_timeout for _, method, sent in self._pending.values()
+                if method not in self.streaming_methods):
+            self._process.kill()
+
+    def shutdown(self):
+        self._shutting_down = True
+        self._restart_timer.stop()
+        self._queued = []
+        process = self._process
+        if process is None:
+            return
+        self._send({'jsonrpc': '2.0', 'id': self._take_id(), 'method': 'shutdown'})
+        self._send({'jsonrpc': '2.0', 'method': 'exit'})
+        process.closeWriteChannel()
+        if not process.waitForFinished(1000):
+            process.kill()
+            process.waitForFinished(1000)
+
+    # ------------------------
+    # Messages
+    # ------------------------
+    def _take_id(self):
+        request_id = self._next_id
+        self._next_id += 1
+        return request_id
+
+    def _send(self, message):
+        if self._process is not None:
+            self._process.write(encode_message(message))
+
+    def request(self, key, method, params):
+        """Send a request and return its id; the answer is delivered as
+        finished(key, result) or failed(key, error)."""
+        request_id = self._take_id()
+        if self._process is None:
+            # Only the first start is immediate; after a crash the server
+            # comes back through _restart.
+            if self._started:
+                self._schedule_restart()
+            else:
+                self.start()
+        if self._process is not None:
+            self._send_request(request_id, key, method, params)
+        elif self._restart_timer.isActive():
+            self._queued.append((request_id, key, method, params))
+        else:
+            QTimer.singleShot(0, lambda: self.failed.emit(key, RuntimeError('language server unavailable')))
+        return request_id
+
+    def _send_request(self, request_id, key, method, params):
+        self._pending[request_id] = (key, method, time.monotonic())
+        self._send({'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+
+    def notify(self, method, params):
+        self._send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    def cancel(self, request_id):
+        # The server skips it if it has not started on it; a late answer
+        # is dropped here either way.
+        if self._pending.pop(request_id, None) is not None:
+            self.notify('$/cancelRequest', {'id': request_id})
+        self._queued = [entry for entry in self._queued if entry[0] != request_id]
+
+    def _on_output(self):
+        process = self._process
+        if process is None:
+            return
+        try:
+            messages = self._reader.feed(bytes(process.readAllStandardOutput()))
+        except (ValueError, RpcError):
+            process.kill()
+            return
+        for message in messages:
+            if message.get('method') == '$/partialResult':
+                params = message.get('params', {})
+                entry = self._pending.get(params.get('id'))
+                if entry is not None:
+                    # Still making progress, so the watchdog leaves it alone.
+                    self._pending[params['id']] = (entry[0], entry[1], time.monotonic())
+                    self.partial.emit(entry[0], params.get('items', []))
+                continue
+            entry = self._pending.pop(message.get('id'), None)
+            if entry is None:
+                continue
+            key = entry[0]
+            error = message.get('error')
+            if error is not None:
+                if error.get('code') == DOCUMENT_OUT_OF_SYNC:
+                    self._resync()
+                self.failed.emit(key, RpcError(error.get('code'), error.get('message')))
+            else:
+                self.finished.emit(key, message.get('result'))
+
+    # ------------------------
+    # Documents and workspace
+    # ------------------------
+    def _notify_open(self, uri, version, lines):
+        self.notify('textDocument/didOpen', {'uri': uri, 'version': version, 'text': '\n'.join(lines)})
+
+    def _resync(self):
+        for uri, (version, lines) in self._documents.items():
+            self._notify_open(uri, version, lines)
+
+    def open_document(self, uri, text):
+        self._documents[uri] = [0, text.split('\n')]
+        self._notify_open(uri, 0, self._documents[uri][1])
+
+    def change_document(self, uri, first, removed, lines):
+        """Replace removed lines from first on with lines (0-based block numbers)."""
+        document = self._documents.get(uri)
+        if document is None:
+            return
+        document[0] += 1
+        document[1][first:first + removed] = lines
+        self.notify('textDocument/didChange', {'uri': uri, 'version': document[0], 'first': first,
+                                               'removed': removed, 'lines': lines})
+
+    def close_document(self, uri):
+        if self._documents.pop(uri, None) is not None:
+            self.notify('textDocument/didClose', {'uri': uri})
+
+    def set_workspace(self, folder):
+        self.folder = os.path.abspath(folder) if folder else None
+        self.notify('workspace/didChangeFolder', {'folder': self.folder})
+
+    def workspace_completions(self, prefix):
+        # Names defined anywhere in the workspace, from the index on this side.
+        index = self.workspace_index
+        if index is None or not index.is_open():
+            return ()
+        return tuple(index.completions(prefix))
+
+    def stats(self):
+        return self.completion_stats
+
+
+_language_client = None
+
+
+def language_client():
+    global _language_client
+    if _language_client is None:
+        _language_client = LanguageClient()
+        # Scripts that never run the event loop get no aboutToQuit.
+        atexit.register(_language_client.shutdown)
+    return _language_client
@@ -0,0 +1,444 @@
+from collections import deque
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+try:
+    import jedi
+    HAS_JEDI = True
+except ImportError:
+    HAS_JEDI = False
+
+from jsonrpc import (
+    DOCUMENT_OUT_OF_SYNC, INTERNAL_ERROR, INVALID_PARAMS, METHOD_NOT_FOUND, REQUEST_CANCELLED,
+    RpcError, encode_message, read_message,
+)
+from workspace_files import iter_python_files
+
+
+class JediEngine:
+    """Jedi completions for the folder open in the file explorer.
+
+    One jedi.Project is kept per folder, so sys.path and environment
+    lookups survive between requests, and scripts are created with the
+    tab's real path, which lets workspace imports resolve and lets jedi's
+    parser cache reuse the previous parse of the same file.
+    """
+
+    untitled_name = 'untitled.py'
+
+    def __init__(self):
+        self.folder = None
+        self.project = None
+        self._projects = {}
+        self._warm = set()
+        self._warmed_modules = set()
+        self.first_times = {}
+        self.warm_count = 0
+        self.warm_total = 0.0
+        self.last_time = 0.0
+
+    def set_workspace(self, folder):
+        folder = os.path.abspath(folder) if folder else None
+        self.folder = folder
+        if not HAS_JEDI or folder is None:
+            self.project = None
+            return
+        project = self._projects.get(folder)
+        if project is None:
+            project = self._projects[folder] = jedi.Project(folder)
+        self.project = project
+
+    def script_path(self, file_path):
+        if file_path:
+            return os.path.abspath(file_path)
+        return os.path.join(self.folder or os.getcwd(), self.untitled_name)
+
+    def script(self, code, file_path):
+        return jedi.Script(code=code, path=self.script_path(file_path), project=self.project)
+
+    def complete(self, code, line, column, file_path=None):
+        """Return (suggestions, seconds taken, whether it was a cold start).
+
+        suggestions is None when jedi failed or found nothing, in which case
+        the editor falls back to its SymbolTable.
+        """
+        start = time.perf_counter()
+        project = self.project
+        try:
+            completions = self.script(code, file_path).complete(line=line, column=column, fuzzy=True)
+            suggestions = sorted(set(comp.name for comp in completions if comp.name)) or None
+        except Exception:
+            suggestions = None
+        elapsed = time.perf_counter() - start
+        return suggestions, elapsed, self._record(project, elapsed)
+
+    def definitions(self, code, line, column, file_path=None):
+        names = self.script(code, file_path).goto(line=line, column=column, follow_imports=True)
+        current = self.script_path(file_path)
+        return [_location(name, current) for name in names if name.line is not None]
+
+    def references(self, code, line, column, file_path, found, check_cancelled):
+        """Report references to the name at (line, column) through found(),
+        a list at a time: the open document first, then each workspace
+        file that mentions the name. Returns how many were found.
+
+        check_cancelled() is called between files and jedi calls; it raises
+        to stop the search, and may serve other requests meanwhile."""
+        script = self.script(code, file_path)
+        current = self.script_path(file_path)
+        local = script.get_references(line=line, column=column, scope='file')
+        if not local:
+            return 0
+        lines = code.split('\n')
+        found([_location(name, current, lines) for name in local])
+        count = len(local)
+
+        targets = {_definition_key(name) for name in
+                   script.goto(line=line, column=column, follow_imports=True)}
+        targets.discard(None)
+        if not targets or self.folder is None:
+            return count
+        word = re.compile(r'\b%s\b' % re.escape(local[0].name))
+        for path, _, _ in iter_python_files(self.folder):
+            check_cancelled()
+            if os.path.abspath(path) == current:
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    source = file.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            if local[0].name not in source:
+                continue
+            matches = self._matching_names(source, path, word, targets, check_cancelled)
+            if matches:
+                found([_location(name, current, source.split('\n')) for name in matches])
+                count += len(matches)
+        return count
+
+    def _matching_names(self, source, path, word, targets, check_cancelled):
+        # The first occurrence that resolves to a target; jedi then finds
+        # the other uses of that binding in the file.
+        script = jedi.Script(code=source, path=path, project=self.project)
+        for number, text in enumerate(source.split('\n'), 1):
+            for match in word.finditer(text):
+                check_cancelled()
+                try:
+                    names = script.goto(line=number, column=match.start(), follow_imports=True)
+                    if any(_definition_key(name) in targets for name in names):
+                        return script.get_references(line=number, column=match.start(), scope='file')
+                except Exception:
+                    continue
+        return []
+
+    def hover(self, code, line, column, file_path=None):
+        for name in self.script(code, file_path).help(line=line, column=column):
+            text = name.docstring()
+            if text:
+                return text
+        return None
+
+    def warm_up(self, module):
+        """Complete on module's attributes so jedi imports and infers it, and
+        keeps the result in its caches."""
+        start = time.perf_counter()
+        project = self.project
+        key = project.path if project is not None else None
+        if (key, module) not in self._warmed_modules:
+            try:
+                self.script(f'import {module}\n{module}.', None).complete(line=2, column=len(module) + 1)
+            except Exception:
+                pass
+            self._warmed_modules.add((key, module))
+            # The first real request is no longer a cold start.
+            self._warm.add(key)
+        return time.perf_counter() - start
+
+    def _record(self, project, elapsed):
+        key = project.path if project is not None else None
+        self.last_time = elapsed
+        if key not in self._warm:
+            self._warm.add(key)
+            self.first_times[key] = elapsed
+            return True
+        self.warm_count += 1
+        self.warm_total += elapsed
+        return False
+
+    def stats(self):
+        key = self.project.path if self.project is not None else None
+        return {
+            'first': self.first_times.get(key),
+            'last': self.last_time,
+            'warm_mean': self.warm_total / self.warm_count if self.warm_count else None,
+            'warm_count': self.warm_count,
+        }
+
+
+def _location(name, current, lines=None):
+    path = str(name.module_path) if name.module_path else None
+    text = lines[name.line - 1].strip() if lines and 0 < name.line <= len(lines) else ''
+    return {
+        'name': name.name,
+        'type': name.type,
+        'path': path,
+        'line': name.line,
+        'column': name.column,
+        'description': name.description,
+        'text': text,
+        'current': path == current,
+    }
+
+
+def _definition_key(name):
+    if name.line is None:
+        return None
+    return str(name.module_path), name.line, name.column
+
+
+class Document:
+    """An open tab's text as a list of lines (QTextDocument blocks)."""
+
+    def __init__(self, text, version=0):
+        self.lines = text.split('\n')
+        self.version = version
+
+    def apply(self, first, removed, lines):
+        self.lines[first:first + removed] = lines
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+class LanguageServer:
+    """Completion and analysis over JSON-RPC on stdin/stdout.
+
+    The IDE runs this module as a child process (see langclient.py), so
+    jedi's memory and its slow inference calls stay out of the GUI.
+    Requests are served one at a time, in the order they arrive, except
+    that a references search pauses between jedi calls to serve whatever
+    queued up behind it, so completions do not wait for a workspace walk.
+
+    A reader thread queues incoming messages and records cancellations
+    as soon as they are read, so a request cancelled while it waits in
+    the queue is answered with REQUEST_CANCELLED instead of being run.
+
+    Methods:
+        initialize                {folder}
+        workspace/didChangeFolder {folder}                      notification
+        textDocument/didOpen      {uri, text}                   notification
+        textDocument/didChange    {uri, version, first, removed, lines}
+                                                                notification
+        textDocument/didClose     {uri}                         notification
+        textDocument/completion   {uri, path, line, column}
+        textDocument/definition   {uri, path, line, column}
+        textDocument/hover        {uri, path, line, column}
+        textDocument/references   {uri, path, line, column}
+        warmUp                    {module}
+        shutdown, exit
+
+    Lines are 1-based and columns 0-based, as jedi counts them. References
+    are streamed as $/partialResult notifications ({id, items}) before the
+    final answer, and the search stops as soon as it is cancelled.
+    """
+
+    _exclusive_methods = {'textDocument/references', 'shutdown', 'exit'}
+
+    def __init__(self, stdin, stdout):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.engine = JediEngine()
+        self.documents = {}
+        self._incoming = queue.Queue()
+        # A message taken off the queue during a search but left for later.
+        self._held = deque()
+        self._cancelled = set()
+        self._cancelled_lock = threading.Lock()
+        self._request_id = None
+        self._running = True
+        self._handlers = {
+            'initialize': self.initialize,
+            'workspace/didChangeFolder': self.did_change_folder,
+            'textDocument/didOpen': self.did_open,
+            'textDocument/didChange': self.did_change,
+            'textDocument/didClose': self.did_close,
+            'textDocument/completion': self.completion,
+            'textDocument/definition': self.definition,
+            'textDocument/hover': self.hover,
+            'textDocument/references': self.references,
+            'warmUp': self.warm_up,
+            'shutdown': lambda params: None,
+            'exit': self.exit,
+        }
+
+    def run(self):
+        threading.Thread(target=self._read, name='langserver-reader', daemon=True).start()
+        while self._running:
+            message = self._held.popleft() if self._held else self._incoming.get()
+            if message is None:
+                break
+            self._dispatch(message)
+
+    def _read(self):
+        while True:
+            try:
+                message = read_message(self.stdin)
+            except (OSError, ValueError, RpcError):
+                message = None
+            if message is None:
+                self._incoming.put(None)
+                return
+            if message.get('method') == '$/cancelRequest':
+                with self._cancelled_lock:
+                    self._cancelled.add(message.get('params', {}).get('id'))
+                continue
+            self._incoming.put(message)
+
+    def _dispatch(self, message):
+        request_id = message.get('id')
+        handler = self._handlers.get(message.get('method'))
+        try:
+            if request_id is not None and self._take_cancelled(request_id):
+                raise RpcError(REQUEST_CANCELLED, 'request cancelled')
+            if handler is None:
+                raise RpcError(METHOD_NOT_FOUND, f"unknown method {message.get('method')}")
+            self._request_id = request_id
+            result = handler(message.get('params') or {})
+            response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        except RpcError as error:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'error': error.to_json()}
+        except Exception as error:
+            response = {'jsonrpc': '2.0', 'id': request_id,
+                        'error': {'code': INTERNAL_ERROR, 'message': f'{type(error).__name__}: {error}'}}
+        self._request_id = None
+        if request_id is not None:
+            self._take_cancelled(request_id)
+            self._write(response)
+
+    def _write(self, message):
+        self.stdout.write(encode_message(message))
+        self.stdout.flush()
+
+    def send_partial(self, items):
+        self._write({'jsonrpc': '2.0', 'method': '$/partialResult',
+                     'params': {'id': self._request_id, 'items': items}})
+
+    def check_cancelled(self):
+        self._serve_waiting()
+        with self._cancelled_lock:
+            if self._request_id in self._cancelled:
+                raise RpcError(REQUEST_CANCELLED, 'request cancelled')
+
+    def _serve_waiting(self):
+        # Run the requests and notifications queued behind the current
+        # one. Another search, shutdown and the end of input wait for it,
+        # and so does everything after them, to keep the order.
+        request_id = self._request_id
+        try:
+            while not self._held:
+                try:
+                    message = self._incoming.get_nowait()
+                except queue.Empty:
+                    return
+                if message is None or message.get('method') in self._exclusive_methods:
+                    self._held.append(message)
+                else:
+                    self._dispatch(message)
+        finally:
+            self._request_id = request_id
+
+    def _take_cancelled(self, request_id):
+        with self._cancelled_lock:
+            if request_id in self._cancelled:
+                self._cancelled.discard(request_id)
+                return True
+        return False
+
+    def _document(self, params):
+        document = self.documents.get(params.get('uri'))
+        if document is None:
+            raise RpcError(DOCUMENT_OUT_OF_SYNC, f"document {params.get('uri')} is not open")
+        return document
+
+    # ------------------------
+    # Methods
+    # ------------------------
+    def initialize(self, params):
+        self.engine.set_workspace(params.get('folder'))
+        return {'jedi': HAS_JEDI, 'pid': os.getpid()}
+
+    def did_change_folder(self, params):
+        self.engine.set_workspace(params.get('folder'))
+
+    def did_open(self, params):
+        self.documents[params['uri']] = Document(params.get('text', ''), params.get('version', 0))
+
+    def did_change(self, params):
+        document = self.documents.get(params['uri'])
+        if document is None:
+            return
+        if params['version'] != document.version + 1:
+            # A change went missing; requests fail until the client reopens it.
+            del self.documents[params['uri']]
+            return
+        document.apply(params['first'], params['removed'], params['lines'])
+        document.version = params['version']
+
+    def did_close(self, params):
+        self.documents.pop(params['uri'], None)
+
+    def _position(self, params):
+        try:
+            return self._document(params).text(), int(params['line']), int(params['column'])
+        except (KeyError, TypeError, ValueError):
+            raise RpcError(INVALID_PARAMS, 'expected uri, line and column')
+
+    def completion(self, params):
+        code, line, column = self._position(params)
+        if not HAS_JEDI:
+            return {'suggestions': None, 'elapsed': 0.0, 'cold': False, 'stats': self.engine.stats()}
+        suggestions, elapsed, cold = self.engine.complete(code, line, column, params.get('path'))
+        return {'suggestions': suggestions, 'elapsed': elapsed, 'cold': cold, 'stats': self.engine.stats()}
+
+    def definition(self, params):
+        code, line, column = self._position(params)
+        if not HAS_JEDI:
+            return []
+        return self.engine.definitions(code, line, column, params.get('path'))
+
+    def hover(self, params):
+        code, line, column = self._position(params)
+        if not HAS_JEDI:
+            return None
+        return self.engine.hover(code, line, column, params.get('path'))
+
+    def references(self, params):
+        code, line, column = self._position(params)
+        if not HAS_JEDI:
+            return {'count': 0}
+        count = self.engine.references(code, line, column, params.get('path'),
+                                       self.send_partial, self.check_cancelled)
+        return {'count': count}
+
+    def warm_up(self, params):
+        if not HAS_JEDI:
+            return 0.0
+        return self.engine.warm_up(params['module'])
+
+    def exit(self, params):
+        self._running = False
+
+
+def main():
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    # Anything jedi or an inferred module prints must not corrupt the stream.
+    sys.stdout = sys.stderr
+    LanguageServer(stdin, stdout).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+from array import array
+import mmap
+import os
+import re
+import time
+
+from PyQt5.QtWidgets import QAbstractScrollArea, QLabel, QVBoxLayout, QWidget
+from PyQt5.QtGui import QFont, QPainter, QColor
+from PyQt5.QtCore import Qt, QTimer
+
+# Files at least this big open in a LargeFileView instead of a CodeEditor.
+LARGE_FILE_THRESHOLD = 20 * 1024 * 1024
+
+_NEWLINE_RE = re.compile(b'\n')
+
+
+def is_large_file(file_path, threshold=LARGE_FILE_THRESHOLD):
+    try:
+        return os.path.getsize(file_path) >= threshold
+    except OSError:
+        return False
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class LineIndex:
+    """Start offsets of every line in a memory-mapped file.
+
+    The index is built in slices by extend(), so lines become available
+    from the top of the file while the rest is still being scanned.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self.offsets = array('q', [0])
+        self.scanned = 0
+
+    @property
+    def complete(self):
+        return self.scanned >= self.size
+
+    @property
+    def line_count(self):
+        return len(self.offsets)
+
+    def extend(self, budget, chunk=4 * 1024 * 1024):
+        deadline = time.perf_counter() + budget
+        while not self.complete and time.perf_counter() < deadline:
+            end = min(self.scanned + chunk, self.size)
+            self.offsets.extend(m.end() for m in _NEWLINE_RE.finditer(self.data, self.scanned, end))
+            self.scanned = end
+        return self.complete
+
+    def line_bytes(self, line, max_bytes):
+        start = self.offsets[line]
+        if line + 1 < len(self.offsets):
+            end = self.offsets[line + 1] - 1
+        else:
+            end = self.size if self.complete else self.data.find(b'\n', start)
+            if end < 0:
+                end = self.size
+        data = self.data[start:min(end, start + max_bytes)]
+        return data[:-1] if data.endswith(b'\r') else data
+
+
+class LargeFileArea(QAbstractScrollArea):
+    """Read-only viewer that only decodes the lines currently on screen."""
+
+    max_line_bytes = 4096
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.setFont(QFont("Consolas", 12))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.viewport().setAutoFillBackground(True)
+        self.viewport().setStyleSheet("background-color: white;")
+        self._longest_line = 0
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+        self.update_scroll_ranges()
+
+    def line_height(self):
+        return self.fontMetrics().height()
+
+    def visible_line_count(self):
+        return max(1, self.viewport().height() // self.line_height())
+
+    def gutter_width(self):
+        digits = len(str(max(1, self.index.line_count)))
+        return 10 + self.fontMetrics().horizontalAdvance('9') * digits
+
+    def update_scroll_ranges(self):
+        page = self.visible_line_count()
+        vertical = self.verticalScrollBar()
+        vertical.setRange(0, max(0, self.index.line_count - page))
+        vertical.setPageStep(page)
+        text_width = self.viewport().width() - self.gutter_width()
+        horizontal = self.horizontalScrollBar()
+        horizontal.setRange(0, max(0, self._longest_line - text_width))
+        horizontal.setPageStep(max(1, text_width))
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scroll_ranges()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        height = self.line_height()
+        gutter = self.gutter_width()
+        first = self.verticalScrollBar().value()
+        last = min(self.index.line_count, first + self.visible_line_count() + 1)
+        x_offset = self.horizontalScrollBar().value()
+
+        painter.setClipRect(gutter, 0, self.viewport().width() - gutter, self.viewport().height())
+        painter.setPen(QColor("#000000"))
+        longest = self._longest_line
+        for row, line in enumerate(range(first, last)):
+            text = self.index.line_bytes(line, self.max_line_bytes).decode('utf-8', 'replace')
+            text = text.expandtabs(4)
+            width = metrics.horizontalAdvance(text)
+            longest = max(longest, width + 10)
+            painter.drawText(gutter + 5 - x_offset, row * height + metrics.ascent(), text)
+
+        painter.setClipping(False)
+        painter.fillRect(0, 0, gutter, self.viewport().height(), QColor("#f0f0f0"))
+        painter.setPen(Qt.darkGray)
+        for row, line in enumerate(range(first, last)):
+            painter.drawText(0, row * height, gutter - 5, height, Qt.AlignRight, str(line + 1))
+        painter.end()
+
+        if longest != self._longest_line:
+            self._longest_line = longest
+            QTimer.singleShot(0, self.update_scroll_ranges)
+
+    def keyPressEvent(self, event):
+        vertical = self.verticalScrollBar()
+        key = event.key()
+        if key == Qt.Key_Up:
+            vertical.setValue(vertical.value() - 1)
+        elif key == Qt.Key_Down:
+            vertical.setValue(vertical.value() + 1)
+        elif key == Qt.Key_PageUp:
+            vertical.setValue(vertical.value() - vertical.pageStep())
+        elif key == Qt.Key_PageDown:
+            vertical.setValue(vertical.value() + vertical.pageStep())
+        elif key == Qt.Key_Home and event.modifiers() & Qt.ControlModifier:
+            vertical.setValue(0)
+        elif key == Qt.Key_End and event.modifiers() & Qt.ControlModifier:
+            vertical.setValue(vertical.maximum())
+        else:
+            super().keyPressEvent(event)
+
+    def scroll_to_line(self, line):
+        self.verticalScrollBar().setValue(max(0, line - self.visible_line_count() // 2))
+
+
+class LargeFileView(QWidget):
+    """Memory-mapped, read-only tab for files too big for a CodeEditor.
+
+    Highlighting and completion are off; a banner above the text says so.
+    """
+
+    index_budget = 0.01
+
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+        self.index = LineIndex(self._map)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        self.banner = QLabel()
+        self.banner.setStyleSheet("""
+            QLabel {
+                background-color: #fff4ce;
+                border-bottom: 1px solid #e0c97f;
+                padding: 4px 8px;
+                color: #5c4400;
+            }
+        """)
+        layout.addWidget(self.banner)
+        self.area = LargeFileArea(self.index, self)
+        layout.addWidget(self.area)
+        self.setLayout(layout)
+        self.setFocusProxy(self.area)
+
+        self._index_timer = QTimer(self)
+        self._index_timer.setInterval(0)
+        self._index_timer.timeout.connect(self._index_step)
+        self._index_step()
+        if not self.index.complete:
+            self._index_timer.start()
+
+    def _index_step(self):
+        if self.index.extend(self.index_budget):
+            self._index_timer.stop()
+        self.area.update_scroll_ranges()
+        self.update_banner()
+
+    def update_banner(self):
+        lines = f"{self.index.line_count:,} lines"
+        if not self.index.complete:
+            lines += f" (indexing {100 * self.index.scanned // max(1, self.index.size)}%)"
+        self.banner.setText(
+            f"Large file mode: {_format_size(self.index.size)}, {lines}. "
+            "Read-only; syntax highlighting and completion are disabled."
+        )
+
+    def close_file(self):
+        self._index_timer.stop()
+        self.index.data = b''
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,111 @@
+from collections import deque
+import csv
+import json
+import time
+
+# Stages recorded along the keystroke path, in display order.
+STAGES = (
+    ('keystroke', "Key press, total"),
+    ('key_handling', "Key handling"),
+    ('highlight', "Highlighting"),
+    ('completion_server', "Completion (jedi)"),
+    ('completion_round_trip', "Completion (round trip)"),
+    ('completion_ranking', "Completion ranking"),
+    ('popup_layout', "Popup layout"),
+    ('keystroke_to_popup', "Keystroke to popup"),
+)
+
+# Upper bucket edges, in milliseconds; the last bucket is open-ended.
+BUCKET_EDGES_MS = (0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, 533)
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LatencyRecorder:
+    """Rolling per-stage timings: the last window samples of each stage.
+
+    record() is cheap enough for every keystroke; percentiles and bucket
+    counts are only computed when someone asks for them.
+    """
+
+    def __init__(self, window=2000):
+        self.window = window
+        self.enabled = True
+        self._samples = {}
+        self._totals = {}
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self.window)
+            self._totals[stage] = 0
+        samples.append(seconds)
+        self._totals[stage] += 1
+
+    def reset(self):
+        self._samples.clear()
+        self._totals.clear()
+
+    def stages(self):
+        known = [stage for stage, _ in STAGES if stage in self._samples]
+        return known + sorted(stage for stage in self._samples if stage not in known)
+
+    def histogram(self, stage):
+        counts = [0] * (len(BUCKET_EDGES_MS) + 1)
+        for seconds in self._samples.get(stage, ()):
+            milliseconds = seconds * 1000
+            for i, edge in enumerate(BUCKET_EDGES_MS):
+                if milliseconds <= edge:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def summary(self, stage):
+        """count, total recorded, p50, p95, p99 and max (seconds) of the window."""
+        ordered = sorted(self._samples.get(stage, ()))
+        return {
+            'count': len(ordered),
+            'total': self._totals.get(stage, 0),
+            'p50': percentile(ordered, 0.50),
+            'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1] if ordered else None,
+        }
+
+    def export(self, path):
+        """Write the window to path: one row per sample for .csv, otherwise
+        JSON with summaries, bucket counts and the samples in milliseconds."""
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(('stage', 'sample', 'ms'))
+                for stage in self.stages():
+                    for i, seconds in enumerate(self._samples[stage]):
+                        writer.writerow((stage, i, f"{seconds * 1000:.4f}"))
+            return
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'window': self.window,
+            'bucket_edges_ms': list(BUCKET_EDGES_MS),
+            'stages': {
+                stage: {
+                    'summary': self.summary(stage),
+                    'histogram': self.histogram(stage),
+                    'samples_ms': [round(seconds * 1000, 4) for seconds in self._samples[stage]],
+                }
+                for stage in self.stages()
+            },
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+latency_recorder = LatencyRecorder()
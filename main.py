@@ -1,15 +1,32 @@
 import sys
 import os
+import multiprocessing
+import re
+import threading
+from array import array
 from PyQt5.QtWidgets import (
     QMainWindow, QApplication, QFileDialog, QAction,
     QTabWidget, QTextEdit, QSplitter, QVBoxLayout, QWidget,
     QMessageBox,QTreeView, QFileSystemModel,
     QHBoxLayout, QLineEdit, QPushButton, QLabel, QFrame,
-    QCheckBox, QShortcut, QMenu, QInputDialog, QToolButton,QTextEdit,QStackedWidget,QTabBar
+    QCheckBox, QShortcut, QMenu, QInputDialog, QToolButton,QTextEdit,QStackedWidget,QTabBar,
+    QDialog, QListWidget, QListWidgetItem, QTableWidget, QTableWidgetItem, QHeaderView,
+    QTreeWidget, QTreeWidgetItem, QActionGroup
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QObject,QProcess
-from PyQt5.QtGui import QKeySequence, QFont, QTextCharFormat, QTextCursor, QColor, QTextDocument,QFont,QIcon
-from editor import CodeEditor
+from PyQt5.QtCore import Qt, pyqtSignal, QObject,QProcess, QTimer, QPoint, QSettings
+from PyQt5.QtGui import QKeySequence, QFont, QTextCharFormat, QTextCursor, QColor, QIcon
+from completion import WARM_UP_MODULES, imported_modules
+from editor import CodeEditor, CompletionWarmUp, ReplaceAllEdit
+from highlighter import DEFAULT_ENGINE, ENGINES
+from langclient import language_client
+from largefile import LARGE_FILE_THRESHOLD, LargeFileView, is_large_file
+from latency import BUCKET_EDGES_MS, STAGES, latency_recorder
+from search import (
+    SearchResults, compile_pattern, expand_replacement, find_in_files, find_matches, literal_prefilter,
+    plan_replacements, shutdown_search_pool,
+)
+from workers import TaskRunner
+from workspace_index import WorkspaceIndex
 
 def get_icon_path():
     if getattr(sys, 'frozen', False):
@@ -18,9 +35,6 @@ def get_icon_path():
         base_path = os.path.abspath(".")
     return os.path.join(base_path, "resources", "icon.ico")
 
-app = QApplication(sys.argv)
-app.setWindowIcon(QIcon(get_icon_path()))
-
 class OutputEmitter(QObject):
     output_signal = pyqtSignal(str)
 
@@ -128,12 +142,36 @@ class TerminalWidget(QTextEdit):
 
 
 class FindReplaceWidget(QFrame):
+    """Find and replace in the current editor.
+
+    Typing only restarts a short timer; the search itself runs on a worker
+    thread over a snapshot of the text (small documents are searched right
+    away), and just the matches on screen are highlighted, re-picked
+    whenever the editor scrolls. Edits to the document rescan only the
+    lines they touched.
+    """
+
+    search_delay = 150
+    max_visible_highlights = 2000
+    sync_search_limit = 200000
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_ide = parent
         self.current_editor = None
-        self.search_results = []
-        self.current_result_index = -1
+        self.results = SearchResults()
+        self._search_generation = 0
+        self._pending_generation = None
+        self._attached_editor = None
+        self._snapshot = (None, None, "")
+        self.replace_all_edit = None
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.start_search)
+        self.search_runner = TaskRunner('find', parent=self)
+        self.search_runner.finished.connect(self._on_search_finished)
+        self.search_runner.failed.connect(self._on_search_failed)
         
         self.setFrameStyle(QFrame.StyledPanel)
         self.setStyleSheet("""
@@ -222,6 +260,27 @@ class FindReplaceWidget(QFrame):
         self.match_case_cb.setToolTip("Match Case")
         self.match_case_cb.stateChanged.connect(self.on_find_text_changed)
         find_layout.addWidget(self.match_case_cb)
+
+        self.whole_word_cb = QCheckBox("W")
+        self.whole_word_cb.setToolTip("Match Whole Word")
+        self.whole_word_cb.stateChanged.connect(self.on_find_text_changed)
+        find_layout.addWidget(self.whole_word_cb)
+
+        self.regex_cb = QCheckBox(".*")
+        self.regex_cb.setToolTip("Use Regular Expression (\\1 or \\g<name> in Replace)")
+        self.regex_cb.stateChanged.connect(self.on_regex_toggled)
+        find_layout.addWidget(self.regex_cb)
+
+        self.multiline_cb = QCheckBox("↵")
+        self.multiline_cb.setToolTip("Multiline: matches may span lines and . matches a newline")
+        self.multiline_cb.setEnabled(False)
+        self.multiline_cb.stateChanged.connect(self.on_find_text_changed)
+        find_layout.addWidget(self.multiline_cb)
+
+        self.match_label = QLabel("")
+        self.match_label.setMinimumWidth(90)
+        self.match_label.setStyleSheet("font-weight: normal;")
+        find_layout.addWidget(self.match_label)
         
         main_layout.addLayout(find_layout)
         
@@ -253,6 +312,7 @@ class FindReplaceWidget(QFrame):
         
     def show_for_editor(self, editor):
         self.current_editor = editor
+        self._attach(editor)
         self.show()
         self.find_input.setFocus()
         
@@ -260,116 +320,776 @@ class FindReplaceWidget(QFrame):
         if cursor.hasSelection():
             self.find_input.setText(cursor.selectedText())
         self.find_input.selectAll()
-        
+        self.start_search()
+
+    def hideEvent(self, event):
+        self.cancel_replace_all()
+        self.search_timer.stop()
+        self._search_generation += 1
+        self.clear_highlights()
+        self._attach(None)
+        super().hideEvent(event)
+
+    def _attach(self, editor):
+        # Follow the editor's scrolling and edits while the panel is open.
+        old = self._attached_editor
+        if old is editor:
+            return
+        if old is not None:
+            try:
+                old.verticalScrollBar().valueChanged.disconnect(self.update_visible_highlights)
+                old.verticalScrollBar().rangeChanged.disconnect(self.update_visible_highlights)
+                old.document().contentsChange.disconnect(self._on_document_edited)
+                old.cursorPositionChanged.disconnect(self.update_match_label)
+            except (RuntimeError, TypeError):
+                pass
+        self._attached_editor = editor
+        if editor is not None:
+            editor.verticalScrollBar().valueChanged.connect(self.update_visible_highlights)
+            editor.verticalScrollBar().rangeChanged.connect(self.update_visible_highlights)
+            editor.document().contentsChange.connect(self._on_document_edited)
+            editor.cursorPositionChanged.connect(self.update_match_label)
+
+    def _on_document_edited(self, position, chars_removed, chars_added):
+        if not (chars_removed or chars_added) or not self.find_input.text():
+            return
+        if self.replace_all_edit is not None and self.replace_all_edit.is_running():
+            return  # searched again once it is done
+        editor = self.current_editor
+        if (editor is None or self.is_multiline() or self.search_timer.isActive()
+                or self._pending_generation == self._search_generation):
+            # Matches may span lines, or full results are still to come.
+            self.search_timer.start(self.search_delay)
+            return
+        pattern = self.current_pattern()
+        if pattern is None:
+            return
+
+        # Matches never cross a line, so rescanning the edited lines is enough.
+        document = editor.document()
+        first = document.findBlock(position)
+        last = document.findBlock(position + chars_added)
+        if not last.isValid():
+            last = document.lastBlock()
+        start = first.position()
+        end = last.position() + last.length() - 1
+        if end - start > self.sync_search_limit:
+            self.search_timer.start(self.search_delay)
+            return
+        lines = []
+        block = first
+        while block.isValid():
+            lines.append(block.text())
+            if block == last:
+                break
+            block = block.next()
+        # Spelled the way toPlainText() does, like full searches see it.
+        text = '\n'.join(lines).replace('\xa0', ' ').replace('\u2028', '\n')
+        starts, ends = find_matches(text, pattern)
+        delta = chars_added - chars_removed
+        self.results.replace_range(start, end - delta, delta,
+                                   array('q', [offset + start for offset in starts]),
+                                   array('q', [offset + start for offset in ends]))
+        self.update_match_label()
+        self.update_visible_highlights()
+
     def on_find_text_changed(self):
         if not self.current_editor:
             return
             
         find_text = self.find_input.text()
         if not find_text:
+            self.search_timer.stop()
+            self._search_generation += 1
             self.clear_highlights()
-            self.search_results = []
+            self.set_results(SearchResults())
             return
             
-        self.highlight_all_matches(find_text)
-        
-    def highlight_all_matches(self, find_text):
-        if not self.current_editor:
+        self.search_timer.start(self.search_delay)
+
+    def on_regex_toggled(self):
+        self.multiline_cb.setEnabled(self.regex_cb.isChecked())
+        self.on_find_text_changed()
+
+    # ------------------------
+    # Searching
+    # ------------------------
+    def is_multiline(self):
+        return self.regex_cb.isChecked() and self.multiline_cb.isChecked()
+
+    def current_pattern(self):
+        """The compiled find pattern, or None if the box holds a bad regex."""
+        try:
+            pattern = compile_pattern(self.find_input.text(), self.match_case_cb.isChecked(),
+                                      self.regex_cb.isChecked(), self.whole_word_cb.isChecked(),
+                                      self.is_multiline())
+        except re.error as e:
+            self.find_input.setToolTip(f"Invalid regular expression: {e}")
+            self.find_input.setStyleSheet("border: 1px solid #e06c75;")
+            return None
+        if self.find_input.styleSheet():
+            self.find_input.setToolTip("")
+            self.find_input.setStyleSheet("")
+        return pattern
+
+    def document_text(self, editor):
+        # One snapshot per document revision, shared by every query on it.
+        if self._snapshot[0] is not editor or self._snapshot[1] != editor.text_revision:
+            self._snapshot = (editor, editor.text_revision, editor.toPlainText())
+        return self._snapshot[2]
+
+    def start_search(self):
+        self.search_timer.stop()
+        if self.replace_all_edit is not None:
+            self.cancel_replace_all()  # searches again once stopped
             return
-            
-        self.clear_highlights()
+        editor = self.current_editor
+        if editor is None or not self.find_input.text():
+            return
+        self._search_generation += 1
+        generation = self._search_generation
+        pattern = self.current_pattern()
+        if pattern is None:
+            self.set_results(SearchResults())
+            self.match_label.setText("Invalid pattern")
+            return
+        text = self.document_text(editor)
+        if len(text) <= self.sync_search_limit:
+            self.set_results(SearchResults(*find_matches(text, pattern, self.is_multiline())))
+            return
+        self._pending_generation = generation
+        self.search_runner.submit((editor, generation, editor.text_revision), find_matches,
+                                  text, pattern, self.is_multiline(),
+                                  lambda: self._search_generation == generation)
+
+    def _is_current_search(self, key):
+        editor, generation, revision = key
+        return (editor is self.current_editor and generation == self._search_generation
+                and revision == editor.text_revision)
+
+    def _on_search_finished(self, key, result):
+        if key[1] == 'replace':
+            self._apply_replace_plan(key, result)
+            return
+        if key[1] == self._pending_generation:
+            self._pending_generation = None
+        if result is None or not self._is_current_search(key):
+            return
+        self.set_results(SearchResults(*result))
 
-        flags = QTextDocument.FindFlag(0)
-        if self.match_case_cb.isChecked():
-            flags |= QTextDocument.FindCaseSensitively
-            
-        self.search_results = []
-        cursor = self.current_editor.textCursor()
-        cursor.movePosition(QTextCursor.Start)
-        
+    def _on_search_failed(self, key, error):
+        if key[1] == 'replace':
+            self.replace_all_btn.setEnabled(True)
+            if isinstance(error, (re.error, IndexError)):
+                QMessageBox.warning(self, "Replace All", f"Invalid replacement: {error}")
+            else:
+                self.match_label.setText("Replace failed")
+            return
+        if key[1] == self._pending_generation:
+            self._pending_generation = None
+        if self._is_current_search(key):
+            self.set_results(SearchResults())
+            self.match_label.setText("Search failed")
+
+    def set_results(self, results):
+        self.results = results
+        self.update_match_label()
+        self.update_visible_highlights()
+
+    def update_match_label(self):
+        total = len(self.results)
+        if not self.find_input.text():
+            self.match_label.setText("")
+            return
+        if not total:
+            self.match_label.setText("No results")
+            return
+        index = -1
+        if self.current_editor is not None:
+            cursor = self.current_editor.textCursor()
+            index = self.results.index_of(cursor.selectionStart(), cursor.selectionEnd())
+        self.match_label.setText(f"{index + 1} of {total}" if index >= 0 else f"? of {total}")
+
+    def update_visible_highlights(self):
+        editor = self.current_editor
+        if editor is None or not self.isVisible():
+            return
+        results = self.results
+        if not len(results):
+            self.clear_highlights()
+            return
+        viewport = editor.viewport().rect()
+        top = editor.cursorForPosition(viewport.topLeft()).block()
+        bottom = editor.cursorForPosition(QPoint(viewport.right(), viewport.bottom())).block()
+        first = results.bisect(top.position())
+        last = results.bisect(bottom.position() + bottom.length())
+        last = min(last, first + self.max_visible_highlights)
+
+        highlight_format = QTextCharFormat()
+        highlight_format.setBackground(QColor(255, 255, 0, 100))
         extra_selections = []
-        
-        while True:
-            cursor = self.current_editor.document().find(find_text, cursor, flags)
-            if cursor.isNull():
-                break
-
-            self.search_results.append({
-                'start': cursor.selectionStart(),
-                'end': cursor.selectionEnd()
-            })
-            
-            highlight_format = QTextCharFormat()
-            highlight_format.setBackground(QColor(255, 255, 0, 100)) 
-            
+        for index in range(first, last):
+            start, end = results.span(index)
             selection = QTextEdit.ExtraSelection()
-            selection.cursor = cursor
+            selection.cursor = editor.textCursor()
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QTextCursor.KeepAnchor)
             selection.format = highlight_format
             extra_selections.append(selection)
-            
-        self.current_editor.setExtraSelections(extra_selections)
-        
-        self.current_result_index = -1
+        editor.set_extra_selections('find', extra_selections)
             
     def clear_highlights(self):
         if self.current_editor:
-            self.current_editor.setExtraSelections([])
+            self.current_editor.set_extra_selections('find', [])
             
     def find_next(self):
-        if not self.search_results:
+        if not self.current_editor or not len(self.results):
             return
-            
-        self.current_result_index = (self.current_result_index + 1) % len(self.search_results)
-        self.move_to_result(self.current_result_index)
+
+        # From the cursor: a selected match counts as passed.
+        cursor = self.current_editor.textCursor()
+        self.move_to_result(self.results.next_index(cursor.selectionEnd()))
         
     def find_previous(self):
-        if not self.search_results:
+        if not self.current_editor or not len(self.results):
             return
-            
-        self.current_result_index = (self.current_result_index - 1) % len(self.search_results)
-        self.move_to_result(self.current_result_index)
+
+        cursor = self.current_editor.textCursor()
+        self.move_to_result(self.results.previous_index(cursor.selectionStart()))
         
     def move_to_result(self, index):
-        if not self.current_editor or index >= len(self.search_results):
+        if not self.current_editor or not 0 <= index < len(self.results):
             return
             
-        result = self.search_results[index]
-        
+        start, end = self.results.span(index)
         cursor = self.current_editor.textCursor()
-        cursor.setPosition(result['start'])
-        cursor.setPosition(result['end'], QTextCursor.KeepAnchor)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
         self.current_editor.setTextCursor(cursor)
         self.current_editor.ensureCursorVisible()
         
     def replace_current(self):
         if not self.current_editor:
             return
-            
+
+        pattern = self.current_pattern()
+        if pattern is None or not self.find_input.text():
+            return
         cursor = self.current_editor.textCursor()
-        if cursor.hasSelection():
-            cursor.insertText(self.replace_input.text())
-            self.on_find_text_changed() 
+        match = pattern.fullmatch(cursor.selectedText().replace('\u2029', '\n'))
+        if not cursor.hasSelection() or match is None:
+            self.find_next()
+            return
+        try:
+            replacement = expand_replacement(match, self.replace_input.text(), self.regex_cb.isChecked())
+        except (re.error, IndexError) as e:
+            QMessageBox.warning(self, "Replace", f"Invalid replacement: {e}")
+            return
+        cursor.insertText(replacement)
+        self.find_next()
             
     def replace_all(self):
-        if not self.current_editor:
+        editor = self.current_editor
+        if not editor or not self.find_input.text():
             return
-            
-        find_text = self.find_input.text()
-        replace_text = self.replace_input.text()
-        
-        if not find_text:
+        if self.replace_all_edit is not None and self.replace_all_edit.is_running():
             return
-            
-        text = self.current_editor.toPlainText()
-        
-        if self.match_case_cb.isChecked():
-            new_text = text.replace(find_text, replace_text)
-        else:
-            import re
-            new_text = re.sub(re.escape(find_text), replace_text, text, flags=re.IGNORECASE)
-            
-        self.current_editor.setPlainText(new_text)
-        self.on_find_text_changed()  
+        pattern = self.current_pattern()
+        if pattern is None:
+            return
+
+        # Planned on the worker thread, applied in slices on this one.
+        self.replace_all_btn.setEnabled(False)
+        self.match_label.setText("Replacing...")
+        self.search_runner.submit((editor, 'replace', editor.text_revision), plan_replacements,
+                                  self.document_text(editor), pattern, self.replace_input.text(),
+                                  self.regex_cb.isChecked(), self.is_multiline())
+
+    def _apply_replace_plan(self, key, plan):
+        editor, _, revision = key
+        self.replace_all_btn.setEnabled(True)
+        if plan is None or editor is not self.current_editor or not self.isVisible():
+            return
+        if revision != editor.text_revision:
+            self.match_label.setText("Text changed, not replaced")
+            return
+        if not plan[0]:
+            self.match_label.setText("Nothing to replace")
+            return
+        self.replace_all_btn.setEnabled(False)
+        self.replace_all_edit = ReplaceAllEdit(editor, plan)
+        self.replace_all_edit.progress.connect(self.show_replace_progress)
+        self.replace_all_edit.finished.connect(self.show_replace_finished)
+        self.replace_all_edit.start()
+
+    def show_replace_progress(self, done, total):
+        self.match_label.setText(f"Replacing {done * 100 // total}%")
+
+    def cancel_replace_all(self, editor=None):
+        # What was replaced so far stays, as a single undo step.
+        edit = self.replace_all_edit
+        if edit is not None and (editor is None or edit.editor is editor):
+            edit.cancel()
+
+    def show_replace_finished(self, count):
+        self.replace_all_btn.setEnabled(True)
+        self.replace_all_edit = None
+        if self.parent_ide is not None:
+            self.parent_ide.statusBar().showMessage(f"Replaced {count} occurrence(s)", 5000)
+        self.start_search()
+
+
+class SymbolPalette(QDialog):
+    """Go to Symbol: type part of a name, pick a definition from the workspace index."""
+
+    symbol_chosen = pyqtSignal(str, int, int)
+
+    def __init__(self, workspace_index, parent=None):
+        super().__init__(parent, Qt.Popup)
+        self.workspace_index = workspace_index
+        self.setMinimumWidth(600)
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f5;
+                border: 1px solid #d0d0d0;
+            }
+            QLineEdit {
+                border: 1px solid #ccc;
+                padding: 4px;
+                font-size: 13px;
+            }
+            QListWidget {
+                border: none;
+                font-family: Consolas;
+                font-size: 12px;
+            }
+            QListWidget::item:selected {
+                background-color: #289CFA;
+                color: white;
+            }
+        """)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(6, 6, 6, 6)
+        layout.setSpacing(4)
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("Go to symbol in workspace")
+        self.query_input.textChanged.connect(lambda: self.query_timer.start())
+        self.query_input.returnPressed.connect(self.accept_current)
+        self.query_input.installEventFilter(self)
+        layout.addWidget(self.query_input)
+        self.results = QListWidget()
+        self.results.setMinimumHeight(300)
+        self.results.itemActivated.connect(self.accept_current)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+
+        self.query_timer = QTimer(self)
+        self.query_timer.setSingleShot(True)
+        self.query_timer.setInterval(80)
+        self.query_timer.timeout.connect(self.update_results)
+
+    def show_palette(self):
+        parent = self.parentWidget()
+        if parent is not None:
+            self.move(parent.mapToGlobal(parent.rect().center()).x() - self.minimumWidth() // 2,
+                      parent.mapToGlobal(parent.rect().topLeft()).y() + 60)
+        self.query_input.clear()
+        self.results.clear()
+        if not self.workspace_index.is_open():
+            self.results.addItem("Open a folder to index its symbols")
+        self.show()
+        self.query_input.setFocus()
+
+    def update_results(self):
+        self.results.clear()
+        text = self.query_input.text().strip()
+        if not text:
+            return
+        folder = self.workspace_index.folder or ""
+        for name, kind, path, line, column, container in self.workspace_index.find_symbols(text):
+            label = f"{container}.{name}" if container and kind != 'import' else name
+            item = QListWidgetItem(f"{label}  ({kind})  {os.path.relpath(path, folder)}:{line}")
+            item.setData(Qt.UserRole, (path, line, column))
+            self.results.addItem(item)
+        self.results.setCurrentRow(0)
+
+    def accept_current(self, *_):
+        item = self.results.currentItem()
+        location = item.data(Qt.UserRole) if item is not None else None
+        if location:
+            self.hide()
+            self.symbol_chosen.emit(*location)
+
+    def eventFilter(self, obj, event):
+        if obj is self.query_input and event.type() == event.KeyPress \
+                and event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown):
+            self.results.keyPressEvent(event)
+            return True
+        return super().eventFilter(obj, event)
+
+
+class ReferencesPanel(QWidget):
+    """Definitions or references of a name, filled in as they are found."""
+
+    location_chosen = pyqtSignal(object, object)
+    stop_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.editor = None
+        self.folder = ""
+        self.setStyleSheet("""
+            QLabel {
+                font-size: 11px;
+                font-weight: bold;
+                padding: 2px 4px;
+            }
+            QPushButton {
+                border: 1px solid #ccc;
+                border-radius: 2px;
+                padding: 2px 8px;
+                font-size: 11px;
+                background-color: #fff;
+            }
+            QPushButton:hover {
+                background-color: #e5e5e5;
+            }
+            QListWidget {
+                border: 1px solid #d0d0d0;
+                font-family: Consolas;
+                font-size: 12px;
+            }
+            QListWidget::item:selected {
+                background-color: #289CFA;
+                color: white;
+            }
+        """)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        header = QHBoxLayout()
+        self.title_label = QLabel()
+        header.addWidget(self.title_label)
+        header.addStretch()
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.stop_requested)
+        header.addWidget(self.stop_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close_panel)
+        header.addWidget(close_button)
+        layout.addLayout(header)
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.choose)
+        self.results.itemClicked.connect(self.choose)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+
+    def start(self, editor, title, folder=""):
+        self.editor = editor
+        self.folder = folder
+        self.title = title
+        self.results.clear()
+        self.stop_button.setVisible(True)
+        self.title_label.setText(f"{title}: searching...")
+        self.show()
+
+    def add_locations(self, locations):
+        self.results.setUpdatesEnabled(False)
+        for location in locations:
+            if location['current'] or not location['path']:
+                where = "this file"
+            elif self.folder and location['path'].startswith(self.folder + os.sep):
+                where = os.path.relpath(location['path'], self.folder)
+            else:
+                where = location['path']
+            text = location['text'] or location['description']
+            item = QListWidgetItem(f"{where}:{location['line']}  {text}")
+            item.setData(Qt.UserRole, location)
+            self.results.addItem(item)
+        self.results.setUpdatesEnabled(True)
+        self.title_label.setText(f"{self.title}: {self.results.count()} found, searching...")
+
+    def finish(self, count, message=""):
+        self.stop_button.setVisible(False)
+        text = f"{self.title}: {count} found"
+        if message:
+            text += f" ({message})"
+        self.title_label.setText(text)
+
+    def choose(self, item):
+        location = item.data(Qt.UserRole)
+        if location:
+            self.location_chosen.emit(self.editor, location)
+
+    def close_panel(self):
+        self.stop_requested.emit()
+        self.hide()
+
+
+class FindInFilesPanel(QWidget):
+    """Find in Files: search the explorer's folder, results grouped by file
+    and added as each batch of files is done."""
+
+    location_chosen = pyqtSignal(str, int, int)
+    _found = pyqtSignal(object, object)
+
+    max_results = 20000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = ""
+        self._cancelled = threading.Event()
+        self._cancelled.set()
+        self._file_items = {}
+        self._match_count = 0
+        self.setStyleSheet("""
+            QLabel {
+                font-size: 11px;
+                font-weight: bold;
+                padding: 2px 4px;
+            }
+            QLineEdit {
+                border: 1px solid #ccc;
+                border-radius: 2px;
+                padding: 3px;
+                font-size: 11px;
+            }
+            QPushButton {
+                border: 1px solid #ccc;
+                border-radius: 2px;
+                padding: 2px 8px;
+                font-size: 11px;
+                background-color: #fff;
+            }
+            QPushButton:hover {
+                background-color: #e5e5e5;
+            }
+            QCheckBox {
+                font-size: 11px;
+            }
+            QTreeWidget {
+                border: 1px solid #d0d0d0;
+                font-family: Consolas;
+                font-size: 12px;
+            }
+            QTreeWidget::item:selected {
+                background-color: #289CFA;
+                color: white;
+            }
+        """)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        header = QHBoxLayout()
+        header.addWidget(QLabel("Find in Files:"))
+        self.query_input = QLineEdit()
+        self.query_input.returnPressed.connect(self.start_search)
+        header.addWidget(self.query_input)
+        self.match_case_cb = QCheckBox("Aa")
+        self.match_case_cb.setToolTip("Match Case")
+        header.addWidget(self.match_case_cb)
+        self.whole_word_cb = QCheckBox("W")
+        self.whole_word_cb.setToolTip("Match Whole Word")
+        header.addWidget(self.whole_word_cb)
+        self.regex_cb = QCheckBox(".*")
+        self.regex_cb.setToolTip("Use Regular Expression")
+        header.addWidget(self.regex_cb)
+        search_button = QPushButton("Search")
+        search_button.clicked.connect(self.start_search)
+        header.addWidget(search_button)
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.stop)
+        self.stop_button.setVisible(False)
+        header.addWidget(self.stop_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close_panel)
+        header.addWidget(close_button)
+        layout.addLayout(header)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.itemActivated.connect(self.choose)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+
+        self._found.connect(self.add_results)
+        self._runner = TaskRunner('find-in-files', parent=self)
+        self._runner.finished.connect(self._on_finished)
+        self._runner.failed.connect(self._on_failed)
+        app = QApplication.instance()
+        if app is not None:
+            # After the runner's own shutdown, which cancels a search.
+            app.aboutToQuit.connect(shutdown_search_pool)
+
+    def show_for_folder(self, folder, text=""):
+        self.folder = folder
+        if text:
+            self.query_input.setText(text)
+        self.show()
+        self.query_input.setFocus()
+        self.query_input.selectAll()
+
+    def start_search(self):
+        query = self.query_input.text()
+        if not query or not self.folder:
+            return
+        try:
+            pattern = compile_pattern(query, self.match_case_cb.isChecked(),
+                                      self.regex_cb.isChecked(), self.whole_word_cb.isChecked())
+        except re.error as e:
+            self.status_label.setText(f"Invalid regular expression: {e}")
+            return
+        self.stop()
+        self._cancelled = threading.Event()
+        cancelled = self._cancelled
+        self.results.clear()
+        self._file_items = {}
+        self._match_count = 0
+        self.stop_button.setVisible(True)
+        self.status_label.setText(f"Searching {self.folder}...")
+        literal = literal_prefilter(query, self.match_case_cb.isChecked(), self.regex_cb.isChecked())
+        self._runner.submit(cancelled, find_in_files, self.folder, pattern, False, literal, cancelled,
+                            lambda results: self._found.emit(cancelled, results),
+                            min(4, os.cpu_count() or 1))
+
+    def stop(self):
+        if not self._cancelled.is_set():
+            self._cancelled.set()
+            self.status_label.setText(
+                f"{self._match_count} matches in {len(self._file_items)} files (stopped)")
+        self.stop_button.setVisible(False)
+
+    def add_results(self, cancelled, results):
+        if cancelled is not self._cancelled or cancelled.is_set():
+            return
+        self.results.setUpdatesEnabled(False)
+        for path, matches in results:
+            where = os.path.relpath(path, self.folder) if path.startswith(self.folder + os.sep) else path
+            file_item = QTreeWidgetItem([f"{where} ({len(matches)})"])
+            file_item.setData(0, Qt.UserRole, (path, matches[0][0], matches[0][1]))
+            for line, column, length, preview in matches:
+                item = QTreeWidgetItem([f"{line}:  {preview.strip()}"])
+                item.setData(0, Qt.UserRole, (path, line, column))
+                file_item.addChild(item)
+            self.results.addTopLevelItem(file_item)
+            file_item.setExpanded(True)
+            self._file_items[path] = file_item
+            self._match_count += len(matches)
+        self.results.setUpdatesEnabled(True)
+        if self._match_count >= self.max_results:
+            self.stop()
+            self.status_label.setText(
+                f"{self._match_count} matches in {len(self._file_items)} files (stopped at {self.max_results})")
+            return
+        self.status_label.setText(
+            f"{self._match_count} matches in {len(self._file_items)} files, searching...")
+
+    def _on_finished(self, cancelled, summary):
+        if cancelled is not self._cancelled or summary is None:
+            return
+        self.stop_button.setVisible(False)
+        self.status_label.setText(
+            f"{summary['matches']} matches in {summary['files']} of {summary['searched']} files")
+
+    def _on_failed(self, cancelled, error):
+        if cancelled is self._cancelled:
+            self.stop_button.setVisible(False)
+            self.status_label.setText(f"Search failed: {error}")
+
+    def choose(self, item, column=0):
+        location = item.data(0, Qt.UserRole)
+        if location:
+            self.location_chosen.emit(*location)
+
+    def close_panel(self):
+        self.stop()
+        self.hide()
+
+
+class LatencyDialog(QDialog):
+    """Percentiles of the keystroke-path timings recorded by latency.py."""
+
+    columns = ("Stage", "Samples", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Distribution")
+    bars = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Latency Diagnostics")
+        self.resize(760, 320)
+        layout = QVBoxLayout()
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+        self.note_label = QLabel(
+            f"Last {latency_recorder.window} samples per stage. Distribution buckets: "
+            + ", ".join(f"≤{edge:g}" for edge in BUCKET_EDGES_MS) + " ms and more.")
+        self.note_label.setWordWrap(True)
+        layout.addWidget(self.note_label)
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        buttons.addWidget(reset_button)
+        export_button = QPushButton("Export...")
+        export_button.clicked.connect(self.export)
+        buttons.addWidget(export_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.hide)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        labels = dict(STAGES)
+        stages = latency_recorder.stages()
+        self.table.setRowCount(len(stages))
+        for row, stage in enumerate(stages):
+            summary = latency_recorder.summary(stage)
+            cells = [labels.get(stage, stage), f"{summary['count']} / {summary['total']}"]
+            for name in ('p50', 'p95', 'p99', 'max'):
+                cells.append(f"{summary[name] * 1000:.2f}" if summary[name] is not None else "")
+            cells.append(self.sparkline(latency_recorder.histogram(stage)))
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    def sparkline(self, counts):
+        peak = max(counts) or 1
+        return "".join(self.bars[(len(self.bars) - 1) * count // peak] for count in counts)
+
+    def reset(self):
+        latency_recorder.reset()
+        self.refresh()
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Latency Samples", "latency.json", "JSON (*.json);;CSV (*.csv)")
+        if not path:
+            return
+        try:
+            latency_recorder.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not export: {e}")
 
 
 class CustomTreeView(QTreeView):
@@ -630,6 +1350,8 @@ class FileExplorer(QWidget):
         
         if self.terminal_widget:
             self.terminal_widget.change_working_directory(folder)
+        if self.parent_ide:
+            self.parent_ide.on_workspace_changed(folder)
 
     def show_context_menu(self, position):
         if not self.current_folder:
@@ -718,10 +1440,29 @@ class PythonIDE(QMainWindow):
         self.setWindowTitle("Python IDE")
         self.setWindowIcon(QIcon(get_icon_path())) 
         self.setGeometry(100, 100, 1200, 800)
+        self.settings = QSettings("PythonIDE", "PythonIDE")
+        self.highlighter_engine = self.settings.value("highlighter/engine", DEFAULT_ENGINE)
+        if self.highlighter_engine not in ENGINES:
+            self.highlighter_engine = DEFAULT_ENGINE
         self.init_ui()
         self.init_menu()
         self.init_shortcuts()  
         self.open_files = {}
+        self.large_file_threshold = LARGE_FILE_THRESHOLD
+        self.workspace_index = WorkspaceIndex(self)
+        self.workspace_index.progress.connect(self.show_index_progress)
+        self.workspace_index.finished.connect(self.show_index_finished)
+        language_client().workspace_index = self.workspace_index
+        self.symbol_palette = SymbolPalette(self.workspace_index, self)
+        self.symbol_palette.symbol_chosen.connect(
+            lambda path, line, column: self.open_file_by_path(path, line, column))
+        self.completion_warm_up = CompletionWarmUp(self)
+        self.completion_warm_up.progress.connect(self.show_warm_up_progress)
+        self.completion_warm_up.finished.connect(self.show_warm_up_finished)
+        # After the warm-up's own slot, which forgets what was warmed.
+        language_client().restarted.connect(self.on_language_server_restarted)
+        self._warm_up_started = False
+        self.latency_dialog = None
         self.file_explorer.set_terminal_widget(self.terminal)
 
     def init_ui(self):
@@ -849,6 +1590,17 @@ class PythonIDE(QMainWindow):
         self.tab_bar.tabCloseRequested.connect(self.close_tab)
         editor_container.setLayout(editor_layout)
         right_splitter.addWidget(editor_container)
+
+        self.references_panel = ReferencesPanel(self)
+        self.references_panel.location_chosen.connect(self.go_to_location)
+        self.references_panel.stop_requested.connect(self.stop_references)
+        self.references_panel.hide()
+        right_splitter.addWidget(self.references_panel)
+
+        self.find_in_files_panel = FindInFilesPanel(self)
+        self.find_in_files_panel.location_chosen.connect(self.open_file_by_path)
+        self.find_in_files_panel.hide()
+        right_splitter.addWidget(self.find_in_files_panel)
         
         self.terminal = TerminalWidget(self)
         right_splitter.addWidget(self.terminal)
@@ -901,7 +1653,50 @@ class PythonIDE(QMainWindow):
         find_action.setShortcut('Ctrl+F')
         find_action.triggered.connect(self.show_find_replace)
         edit_menu.addAction(find_action)
-        
+
+        find_in_files_action = QAction('Find in Files', self)
+        find_in_files_action.setShortcut('Ctrl+Shift+F')
+        find_in_files_action.triggered.connect(self.show_find_in_files)
+        edit_menu.addAction(find_in_files_action)
+
+        matching_bracket_action = QAction('Go to Matching Bracket', self)
+        matching_bracket_action.setShortcut('Ctrl+Shift+M')
+        matching_bracket_action.triggered.connect(self.go_to_matching_bracket)
+        edit_menu.addAction(matching_bracket_action)
+
+        definition_action = QAction('Go to Definition', self)
+        definition_action.setShortcut('F12')
+        definition_action.triggered.connect(self.go_to_definition)
+        edit_menu.addAction(definition_action)
+
+        references_action = QAction('Find References', self)
+        references_action.setShortcut('Shift+F12')
+        references_action.triggered.connect(self.find_references)
+        edit_menu.addAction(references_action)
+
+        go_to_symbol_action = QAction('Go to Symbol in Workspace', self)
+        go_to_symbol_action.setShortcut('Ctrl+Shift+O')
+        go_to_symbol_action.triggered.connect(self.show_symbol_palette)
+        edit_menu.addAction(go_to_symbol_action)
+        
+        view_menu = menubar.addMenu('View')
+
+        engine_menu = view_menu.addMenu('Syntax Highlighting')
+        engine_group = QActionGroup(self)
+        for engine in ENGINES:
+            engine_action = QAction(engine.capitalize(), self)
+            engine_action.setCheckable(True)
+            engine_action.setChecked(engine == self.highlighter_engine)
+            engine_action.triggered.connect(lambda _, engine=engine: self.set_highlighter_engine(engine))
+            engine_group.addAction(engine_action)
+            engine_menu.addAction(engine_action)
+
+        tools_menu = menubar.addMenu('Tools')
+
+        latency_action = QAction('Latency Diagnostics', self)
+        latency_action.triggered.connect(self.show_latency_diagnostics)
+        tools_menu.addAction(latency_action)
+
         run_menu = menubar.addMenu('Run')
         
         run_action = QAction('Run', self)
@@ -915,11 +1710,13 @@ class PythonIDE(QMainWindow):
         QShortcut(QKeySequence("Escape"), self, self.hide_find_replace)
         
     def is_untitled_empty(self, editor):
-        return (not hasattr(editor, 'file_path') or editor.file_path is None) and \
+        return isinstance(editor, CodeEditor) and \
+               (not hasattr(editor, 'file_path') or editor.file_path is None) and \
                editor.toPlainText().strip() == ""
         
     def create_new_tab(self, file_path=None, content=""):
         editor = CodeEditor()
+        editor.highlighter.set_engine(self.highlighter_engine)
         editor.setPlainText(content)
         
         if file_path:
@@ -938,9 +1735,94 @@ class PythonIDE(QMainWindow):
         editor.setFocus()
         
         editor.textChanged.connect(lambda: self.mark_tab_modified(editor))
+        editor.completion_timed.connect(self.show_completion_timing)
+        editor.definitions_found.connect(self.show_definitions)
+        editor.references_started.connect(self.show_references_started)
+        editor.references_found.connect(self.show_references_found)
+        editor.references_finished.connect(self.show_references_finished)
         
         return editor
         
+    def on_workspace_changed(self, folder):
+        # Modules queued for the old folder are queued again below.
+        self.completion_warm_up.cancel()
+        language_client().set_workspace(folder)
+        self.workspace_index.open(folder)
+        if self._warm_up_started:
+            self.start_completion_warm_up()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._warm_up_started:
+            self._warm_up_started = True
+            # Queued, so the window paints before jedi starts loading modules.
+            QTimer.singleShot(0, self.start_completion_warm_up)
+
+    def start_completion_warm_up(self):
+        modules = list(WARM_UP_MODULES)
+        for index in range(self.tab_content_widget.count()):
+            editor = self.tab_content_widget.widget(index)
+            if isinstance(editor, CodeEditor):
+                modules.extend(imported_modules(editor.toPlainText()))
+        modules.extend(self.workspace_index.imported_modules())
+        self.completion_warm_up.start(modules)
+
+    def on_language_server_restarted(self):
+        self.statusBar().showMessage("Language server restarted", 5000)
+        if self._warm_up_started:
+            self.start_completion_warm_up()
+
+    def show_warm_up_progress(self, done, total, module):
+        self.statusBar().showMessage(f"Warming up completions: {module} ({done + 1}/{total})")
+
+    def show_warm_up_finished(self, count, elapsed):
+        if count:
+            self.statusBar().showMessage(
+                f"Completions ready: {count} modules preloaded in {elapsed:.1f} s", 5000)
+
+    def set_highlighter_engine(self, engine):
+        self.highlighter_engine = engine
+        self.settings.setValue("highlighter/engine", engine)
+        for index in range(self.tab_content_widget.count()):
+            editor = self.tab_content_widget.widget(index)
+            if isinstance(editor, CodeEditor):
+                editor.highlighter.set_engine(engine)
+
+    def show_latency_diagnostics(self):
+        if self.latency_dialog is None:
+            self.latency_dialog = LatencyDialog(self)
+        self.latency_dialog.show()
+        self.latency_dialog.raise_()
+
+    def show_symbol_palette(self):
+        self.symbol_palette.show_palette()
+
+    def show_index_progress(self, done, total):
+        if total:
+            self.statusBar().showMessage(f"Indexing workspace: {done}/{total} files")
+
+    def show_index_finished(self, summary):
+        if 'error' in summary:
+            self.statusBar().showMessage(f"Workspace indexing failed: {summary['error']}", 5000)
+        else:
+            self.statusBar().showMessage(
+                f"Workspace indexed: {summary['files']} files, {summary['parsed']} parsed", 5000)
+            self.completion_warm_up.start(self.workspace_index.imported_modules())
+
+    def show_completion_timing(self, elapsed, cold):
+        stats = language_client().stats()
+        message = f"Completion: {elapsed * 1000:.0f} ms"
+        if cold:
+            message += " (first request)"
+        elif stats['warm_mean'] is not None:
+            message += f", warm average {stats['warm_mean'] * 1000:.0f} ms"
+            if stats['first'] is not None:
+                message += f", first {stats['first'] * 1000:.0f} ms"
+        editor = self.sender()
+        if isinstance(editor, CodeEditor):
+            message += f", session cache hit rate {editor.completion_cache.stats()['hit_rate']:.0%}"
+        self.statusBar().showMessage(message, 5000)
+
     def mark_tab_modified(self, editor):
         content_index = self.tab_content_widget.indexOf(editor)
         if content_index != -1:
@@ -966,16 +1848,30 @@ class PythonIDE(QMainWindow):
         if file_path:
             self.open_file_by_path(file_path)
             
-    def open_file_by_path(self, file_path):
+    def open_file_by_path(self, file_path, line=None, column=0):
+        self._open_file(file_path)
+        if line is not None:
+            current = self.tab_content_widget.currentWidget()
+            if isinstance(current, CodeEditor) and current.file_path == file_path:
+                current.go_to_line(line, column)
+            elif isinstance(current, LargeFileView) and current.file_path == file_path:
+                current.area.scroll_to_line(line - 1)
+
+    def _open_file(self, file_path):
         if file_path in self.open_files:
             tab_index = self.open_files[file_path]
             self.tab_bar.setCurrentIndex(tab_index)
             self.tab_content_widget.setCurrentIndex(tab_index)
             return
+
+        if is_large_file(file_path, self.large_file_threshold):
+            self.open_large_file(file_path)
+            return
             
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 content = file.read()
+                self.completion_warm_up.start(imported_modules(content))
                 
                 current_index = self.tab_content_widget.currentIndex()
                 if current_index >= 0:
@@ -997,12 +1893,28 @@ class PythonIDE(QMainWindow):
                     
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Could not open file: {str(e)}")
+
+    def open_large_file(self, file_path):
+        try:
+            view = LargeFileView(file_path)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Could not open file: {str(e)}")
+            return
+
+        tab_index = self.tab_bar.addTab(os.path.basename(file_path) + " (read-only)")
+        self.tab_bar.setTabToolTip(tab_index, "Opened in large file mode")
+        self.open_files[file_path] = tab_index
+        content_index = self.tab_content_widget.addWidget(view)
+        self.tab_bar.setCurrentIndex(tab_index)
+        self.tab_content_widget.setCurrentIndex(content_index)
+        view.setFocus()
+        return view
             
     def save_file(self):
         current_index = self.tab_content_widget.currentIndex()
         if current_index >= 0:
             current_editor = self.tab_content_widget.widget(current_index)
-            if current_editor:
+            if isinstance(current_editor, CodeEditor):
                 if hasattr(current_editor, 'file_path') and current_editor.file_path:
                     self.save_file_to_path(current_editor, current_editor.file_path)
                 else:
@@ -1012,7 +1924,7 @@ class PythonIDE(QMainWindow):
         current_index = self.tab_content_widget.currentIndex()
         if current_index >= 0:
             current_editor = self.tab_content_widget.widget(current_index)
-            if current_editor:
+            if isinstance(current_editor, CodeEditor):
                 file_path, _ = QFileDialog.getSaveFileName(
                     self, "Save File", "", "Python Files (*.py);;All Files (*)"
                 )
@@ -1060,6 +1972,7 @@ class PythonIDE(QMainWindow):
             elif reply == QMessageBox.Cancel:
                 return
 
+        self.find_replace_widget.cancel_replace_all(editor)
         if hasattr(editor, 'file_path') and editor.file_path in self.open_files:
             del self.open_files[editor.file_path]
         
@@ -1068,6 +1981,8 @@ class PythonIDE(QMainWindow):
                 self.open_files[file_path] = index - 1
         self.tab_bar.removeTab(tab_index)
         self.tab_content_widget.removeWidget(editor)
+        if isinstance(editor, LargeFileView):
+            editor.close_file()
         editor.deleteLater()
         
         if self.tab_bar.count() == 0:
@@ -1082,9 +1997,79 @@ class PythonIDE(QMainWindow):
         current_index = self.tab_content_widget.currentIndex()
         if current_index >= 0:
             current_editor = self.tab_content_widget.widget(current_index)
-            if current_editor:
+            if isinstance(current_editor, CodeEditor):
                 self.find_replace_widget.show_for_editor(current_editor)
             
+    def show_find_in_files(self):
+        folder = self.file_explorer.current_folder
+        if not folder:
+            self.statusBar().showMessage("Open a folder to search it", 5000)
+            return
+        text = ""
+        current_editor = self.tab_content_widget.currentWidget()
+        if isinstance(current_editor, CodeEditor) and current_editor.textCursor().hasSelection():
+            text = current_editor.textCursor().selectedText()
+        self.find_in_files_panel.show_for_folder(folder, text)
+
+    def go_to_definition(self):
+        current_editor = self.tab_content_widget.currentWidget()
+        if isinstance(current_editor, CodeEditor):
+            current_editor.go_to_definition()
+
+    def find_references(self):
+        current_editor = self.tab_content_widget.currentWidget()
+        if isinstance(current_editor, CodeEditor):
+            current_editor.find_references()
+
+    def stop_references(self):
+        editor = self.references_panel.editor
+        if isinstance(editor, CodeEditor):
+            editor.cancel_references()
+
+    def show_references_started(self, name):
+        editor = self.sender()
+        if self.references_panel.editor is not editor:
+            self.stop_references()
+        self.references_panel.start(editor, f"References to '{name}'", self.workspace_index.folder or "")
+
+    def show_references_found(self, locations):
+        if self.sender() is self.references_panel.editor:
+            self.references_panel.add_locations(locations)
+
+    def show_references_finished(self, count, message):
+        if self.sender() is self.references_panel.editor:
+            self.references_panel.finish(count, message)
+
+    def show_definitions(self, name, locations):
+        editor = self.sender()
+        if not locations:
+            self.statusBar().showMessage(f"No definition found for '{name}'", 5000)
+        elif len(locations) == 1:
+            self.go_to_location(editor, locations[0])
+        else:
+            self.stop_references()
+            self.references_panel.start(editor, f"Definitions of '{name}'", self.workspace_index.folder or "")
+            self.references_panel.add_locations(locations)
+            self.references_panel.finish(len(locations))
+
+    def go_to_location(self, editor, location):
+        if location['current'] and isinstance(editor, CodeEditor):
+            index = self.tab_content_widget.indexOf(editor)
+            if index >= 0:
+                self.tab_bar.setCurrentIndex(index)
+                self.tab_content_widget.setCurrentIndex(index)
+                editor.go_to_line(location['line'], location['column'])
+                return
+        if location['path'] and os.path.isfile(location['path']):
+            self.open_file_by_path(location['path'], location['line'], location['column'])
+        else:
+            self.statusBar().showMessage(f"Cannot open {location['path']}", 5000)
+
+    def go_to_matching_bracket(self):
+        current_editor = self.tab_content_widget.currentWidget()
+        if isinstance(current_editor, CodeEditor):
+            current_editor.jump_to_matching_bracket()
+
     def hide_find_replace(self):
         self.find_replace_widget.hide()
         
@@ -1093,11 +2078,12 @@ class PythonIDE(QMainWindow):
         if current_index >= 0:
             current_editor = self.tab_content_widget.widget(current_index)
             if current_editor:
-                code = current_editor.toPlainText()
+                code = current_editor.toPlainText() if isinstance(current_editor, CodeEditor) else None
                 file_path = getattr(current_editor, 'file_path', None)
                 self.terminal.run_python_code(code, file_path)
     
     def closeEvent(self, event):
+        self.completion_warm_up.cancel()
         try:
             if hasattr(self, 'terminal') and self.terminal:
                 self.terminal.stop_process()
@@ -1129,6 +2115,7 @@ class PythonIDE(QMainWindow):
 
 def main():
     app = QApplication(sys.argv)
+    app.setWindowIcon(QIcon(get_icon_path()))
     app.setStyle('Fusion')
     ide = PythonIDE()
     ide.show()
@@ -1136,4 +2123,7 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # The workspace indexer spawns worker processes that re-import this
+    # module; frozen builds need freeze_support() to route them correctly.
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,336 @@
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import atexit
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+
+from workspace_files import iter_files
+
+# Characters outside the BMP take two positions in a QTextDocument
+# (UTF-16) but one in a Python string.
+_ASTRAL_RE = re.compile('[\U00010000-\U0010ffff]')
+
+
+def astral_offsets(text):
+    return [match.start() for match in _ASTRAL_RE.finditer(text)]
+
+
+@lru_cache(maxsize=64)
+def compile_pattern(query, case_sensitive=False, regex=False, whole_word=False, multiline=False):
+    """Compile query for the find panel; raises re.error for a bad regex.
+
+    ^ and $ always anchor at line ends. Only in multiline mode does . match
+    a newline and may a match span lines.
+    """
+    source = query if regex else re.escape(query)
+    if whole_word:
+        source = rf'(?<!\w)(?:{source})(?!\w)'
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    if multiline:
+        flags |= re.DOTALL
+    return re.compile(source, flags)
+
+
+def find_matches(text, pattern, multiline=False, is_current=None):
+    """Return (starts, ends) document positions, as array('q'), of every
+    non-empty match of pattern in text, or None once is_current() turns
+    false. Without multiline, matches spanning a line break are left out."""
+    astral = astral_offsets(text)
+    starts = array('q')
+    ends = array('q')
+    for count, match in enumerate(pattern.finditer(text)):
+        if not count % 4096 and is_current is not None and not is_current():
+            return None
+        start, end = match.span()
+        if start == end or (not multiline and text.find('\n', start, end) >= 0):
+            continue
+        if astral:
+            start += bisect_left(astral, start)
+            end += bisect_left(astral, end)
+        starts.append(start)
+        ends.append(end)
+    return starts, ends
+
+
+class SearchResults:
+    """Match positions of a query in a document, kept in step with edits.
+
+    Starts and ends sit in two array('q') buffers, 16 bytes a match. An
+    edit only rescans the lines it touched (replace_range); everything
+    after them moves by one pending shift: entries from _shift_index on
+    are stored _shift too low, and the boundary only moves as far as the
+    next edit is from the last, so typing in one place stays cheap
+    however many matches follow it.
+    """
+
+    def __init__(self, starts=None, ends=None):
+        self._starts = starts if starts is not None else array('q')
+        self._ends = ends if ends is not None else array('q')
+        self._shift_index = len(self._starts)
+        self._shift = 0
+
+    def __len__(self):
+        return len(self._starts)
+
+    def span(self, index):
+        shift = self._shift if index >= self._shift_index else 0
+        return self._starts[index] + shift, self._ends[index] + shift
+
+    def bisect(self, position):
+        """Index of the first match starting at or after position."""
+        boundary = self._shift_index
+        if boundary and self._starts[boundary - 1] >= position:
+            return bisect_left(self._starts, position, 0, boundary)
+        return bisect_left(self._starts, position - self._shift, boundary)
+
+    def index_of(self, start, end):
+        """Index of the match spanning exactly start to end, or -1."""
+        index = self.bisect(start)
+        if index < len(self._starts) and self.span(index) == (start, end):
+            return index
+        return -1
+
+    def next_index(self, position):
+        """First match starting at or after position, wrapping around."""
+        if not self._starts:
+            return -1
+        index = self.bisect(position)
+        return index if index < len(self._starts) else 0
+
+    def previous_index(self, position):
+        """Last match starting before position, wrapping around."""
+        if not self._starts:
+            return -1
+        index = self.bisect(position) - 1
+        return index if index >= 0 else len(self._starts) - 1
+
+    def _move_shift(self, index):
+        boundary, shift = self._shift_index, self._shift
+        if shift and index != boundary:
+            low, high = min(index, boundary), max(index, boundary)
+            if index < boundary:
+                shift = -shift
+            for values in (self._starts, self._ends):
+                values[low:high] = array('q', [value + shift for value in values[low:high]])
+        self._shift_index = index
+
+    def replace_range(self, start, end, delta, starts, ends):
+        """An edit turned the text from start to end (old positions) into
+        delta more characters: drop the matches starting there, move the
+        later ones by delta and insert starts/ends, the matches in the new
+        text of the range, given as new positions."""
+        first = self.bisect(start)
+        last = self.bisect(end)
+        self._move_shift(last)
+        del self._starts[first:last]
+        del self._ends[first:last]
+        self._shift += delta
+        self._starts[first:first] = starts
+        self._ends[first:first] = ends
+        self._shift_index = first + len(starts)
+
+
+def expand_replacement(match, template, regex=False):
+    """The text replacing match: template with \\1, \\g<name> and the
+    like filled in for a regex search, template as is otherwise."""
+    return match.expand(template) if regex else template
+
+
+def plan_replacements(text, pattern, template, regex=False, multiline=False, is_current=None):
+    """Work out a Replace All over text, or None once is_current() turns false.
+
+    Returns (starts, ends, first_lines, last_lines, replacements) for every
+    match whose replacement differs from it: document positions and the
+    0-based lines each match starts and ends on, in document order.
+    """
+    astral = astral_offsets(text)
+    starts = array('q')
+    ends = array('q')
+    first_lines = array('q')
+    last_lines = array('q')
+    replacements = []
+    line = 0
+    position = 0
+    for count, match in enumerate(pattern.finditer(text)):
+        if not count % 4096 and is_current is not None and not is_current():
+            return None
+        start, end = match.span()
+        if start == end or (not multiline and text.find('\n', start, end) >= 0):
+            continue
+        replacement = expand_replacement(match, template, regex)
+        if replacement == match.group():
+            continue
+        line += text.count('\n', position, start)
+        first_lines.append(line)
+        line += text.count('\n', start, end)
+        last_lines.append(line)
+        position = end
+        if astral:
+            start += bisect_left(astral, start)
+            end += bisect_left(astral, end)
+        starts.append(start)
+        ends.append(end)
+        replacements.append(replacement)
+    return starts, ends, first_lines, last_lines, replacements
+
+
+# ------------------------
+# Find in Files (search_files runs in the worker processes)
+# ------------------------
+BINARY_SNIFF_BYTES = 8192
+MAX_FILE_SIZE = 32 * 1024 * 1024
+MAX_MATCHES_PER_FILE = 1000
+PREVIEW_LENGTH = 200
+
+
+def search_file(path, pattern, multiline=False, literal=None):
+    """Return [(line, column, length, preview)] for the matches in a file.
+
+    The file is mapped rather than read: binary files (a NUL byte near the
+    start) and, given the literal bytes a match must contain, files
+    without them are skipped before anything is decoded.
+    """
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if not size or size > MAX_FILE_SIZE:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data.find(b'\0', 0, BINARY_SNIFF_BYTES) >= 0:
+                    return []
+                if literal is not None and data.find(literal) < 0:
+                    return []
+                text = data[:].decode('utf-8', errors='replace')
+    except (OSError, ValueError):
+        return []
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    matches = []
+    line = 1
+    line_start = 0
+    position = 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if start == end or (not multiline and text.find('\n', start, end) >= 0):
+            continue
+        newlines = text.count('\n', position, start)
+        if newlines:
+            line += newlines
+            line_start = text.rfind('\n', 0, start) + 1
+        position = start
+        line_end = text.find('\n', start)
+        if line_end < 0:
+            line_end = len(text)
+        matches.append((line, start - line_start, end - start,
+                        text[line_start:min(line_end, line_start + PREVIEW_LENGTH)]))
+        if len(matches) >= MAX_MATCHES_PER_FILE:
+            break
+    return matches
+
+
+def search_files(paths, pattern, multiline=False, literal=None):
+    """search_file over a batch: (path, matches) for the files with any."""
+    results = []
+    for path in paths:
+        matches = search_file(path, pattern, multiline, literal)
+        if matches:
+            results.append((path, matches))
+    return results
+
+
+def literal_prefilter(query, case_sensitive=False, regex=False):
+    # Bytes every match must contain, when that can be known without
+    # decoding: only for a case-sensitive plain-text query.
+    if regex or not case_sensitive:
+        return None
+    return query.encode('utf-8')
+
+
+_pool = None
+
+
+def _search_pool(max_workers):
+    # One pool for every search, so each query does not pay for starting
+    # the worker interpreters.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                    mp_context=multiprocessing.get_context('spawn'))
+        # Scripts that never run the event loop get no aboutToQuit.
+        atexit.register(shutdown_search_pool)
+    return _pool
+
+
+def shutdown_search_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def find_in_files(folder, pattern, multiline, literal, cancelled, found,
+                  max_workers=None, batch_size=32):
+    """Search every text file under folder; runs on a worker thread.
+
+    Batches of files are handed to the process pool while the folder is
+    still being walked, and each batch's results are passed to found() as
+    soon as it is done. Returns a summary, or None if cancelled was set.
+    """
+    global _pool
+    pool = _search_pool(max_workers)
+    done = queue.Queue()
+    submitted = []
+    searched = files = matches = 0
+
+    def submit(paths):
+        future = pool.submit(search_files, paths, pattern, multiline, literal)
+        future.add_done_callback(done.put)
+        submitted.append(future)
+
+    def report(future):
+        nonlocal files, matches
+        results = future.result()
+        if results:
+            files += len(results)
+            matches += sum(len(found_matches) for _, found_matches in results)
+            found(results)
+
+    reported = 0
+    batch = []
+    try:
+        for entry in iter_files(folder, cancelled):
+            batch.append(entry.path)
+            searched += 1
+            if len(batch) == batch_size:
+                submit(batch)
+                batch = []
+            while not done.empty() and not cancelled.is_set():
+                report(done.get_nowait())
+                reported += 1
+        if batch:
+            submit(batch)
+        while reported < len(submitted) and not cancelled.is_set():
+            try:
+                future = done.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            report(future)
+            reported += 1
+    except BrokenProcessPool:
+        _pool = None
+        raise
+    finally:
+        for future in submitted:
+            future.cancel()
+    if cancelled.is_set():
+        return None
+    return {'searched': searched, 'files': files, 'matches': matches}
@@ -0,0 +1,287 @@
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import ast
+import atexit
+import hashlib
+import multiprocessing
+import re
+import symtable
+
+# Spans are stored per line as flat array('I') triples of
+# (column, length, index into SEMANTIC_KINDS).
+SEMANTIC_KINDS = (
+    'parameter', 'local', 'global', 'imported', 'attribute', 'class_name', 'function_name',
+)
+_KIND_INDEX = {kind: i for i, kind in enumerate(SEMANTIC_KINDS)}
+_COMPREHENSION_SCOPES = {
+    ast.ListComp: 'listcomp', ast.SetComp: 'setcomp',
+    ast.DictComp: 'dictcomp', ast.GeneratorExp: 'genexpr',
+}
+_DEFINITION_RE = re.compile(r'(?:async\s+)?(?:def|class)\s+')
+_IMPLICIT_NAMES = frozenset(('self', 'cls'))
+
+
+def content_key(source):
+    return hashlib.blake2b(source.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+def analyze(source):
+    """Classify the names in source by what they refer to.
+
+    Returns {line_index: (line_text, spans)}. Raises SyntaxError when the
+    source does not parse.
+    """
+    tree = ast.parse(source)
+    module = symtable.symtable(source, '<editor>', 'exec')
+    collector = _SemanticCollector(source.split('\n'), module)
+    collector.visit(tree)
+    return {row: (collector.lines[row], spans) for row, spans in collector.spans.items()}
+
+
+def _analyze_spans(source):
+    # Runs in the analysis process; the line texts are put back by the caller.
+    return {row: spans for row, (_, spans) in analyze(source).items()}
+
+
+_pool = None
+
+
+def analyze_in_process(source):
+    """analyze() in a child process, for callers on a worker thread.
+
+    ast.parse and symtable hold the GIL for their whole run, so on a large
+    file a thread would stall the GUI; waiting on the process does not.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        # Scripts that never run the event loop get no aboutToQuit.
+        atexit.register(shutdown_analysis_pool)
+    try:
+        table = _pool.submit(_analyze_spans, source).result()
+    except BrokenProcessPool:
+        _pool = None
+        raise
+    lines = source.split('\n')
+    return {row: (lines[row], spans) for row, spans in table.items()}
+
+
+def shutdown_analysis_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _SemanticCollector(ast.NodeVisitor):
+    def __init__(self, lines, module):
+        self.lines = lines
+        self.module = module
+        self.stack = [module]
+        self.spans = {}
+        self.scopes = defaultdict(deque)
+        self._index_scopes(module)
+
+    def _index_scopes(self, table):
+        for child in table.get_children():
+            self.scopes[(child.get_name(), child.get_lineno())].append(child)
+            self._index_scopes(child)
+
+    # ------------------------
+    # Positions
+    # ------------------------
+    def _column(self, lineno, byte_col):
+        line = self.lines[lineno - 1]
+        if line.isascii():
+            return byte_col
+        return len(line.encode('utf-8')[:byte_col].decode('utf-8', 'ignore'))
+
+    def _add(self, lineno, col, name, kind):
+        if 0 < lineno <= len(self.lines):
+            spans = self.spans.setdefault(lineno - 1, array('I'))
+            spans.extend((col, len(name), _KIND_INDEX[kind]))
+
+    def _add_at(self, lineno, byte_col, name, kind):
+        self._add(lineno, self._column(lineno, byte_col), name, kind)
+
+    def _add_before_end(self, node, name, kind):
+        end = self._column(node.end_lineno, node.end_col_offset)
+        self._add(node.end_lineno, end - len(name), name, kind)
+
+    def _add_definition_name(self, node, kind):
+        line = self.lines[node.lineno - 1]
+        match = _DEFINITION_RE.match(line, self._column(node.lineno, node.col_offset))
+        if match and line.startswith(node.name, match.end()):
+            self._add(node.lineno, match.end(), node.name, kind)
+
+    # ------------------------
+    # Symbols
+    # ------------------------
+    def _enter(self, name, lineno):
+        candidates = self.scopes.get((name, lineno))
+        table = candidates.popleft() if candidates else self.stack[-1]
+        self.stack.append(table)
+
+    def _leave(self):
+        self.stack.pop()
+
+    def _describe(self, symbol, table):
+        if symbol.is_parameter():
+            return 'parameter'
+        if symbol.is_imported():
+            return 'imported'
+        if symbol.is_namespace():
+            namespace_type = symbol.get_namespaces()[0].get_type()
+            return 'class_name' if namespace_type == 'class' else 'function_name'
+        if table is self.module:
+            return 'global' if symbol.is_local() else None
+        return 'local' if symbol.is_local() else None
+
+    def _classify(self, name):
+        table = self.stack[-1]
+        try:
+            symbol = table.lookup(name)
+        except KeyError:
+            return None
+        if symbol.is_free():
+            # Defined in an enclosing function; class bodies are not visible.
+            for outer in reversed(self.stack[:-1]):
+                if outer.get_type() == 'class':
+                    continue
+                try:
+                    outer_symbol = outer.lookup(name)
+                except KeyError:
+                    continue
+                if outer_symbol.is_local():
+                    return self._describe(outer_symbol, outer)
+            return None
+        if table is not self.module and symbol.is_global():
+            try:
+                symbol = self.module.lookup(name)
+            except KeyError:
+                return None
+            table = self.module
+        return self._describe(symbol, table)
+
+    # ------------------------
+    # Visitors
+    # ------------------------
+    def visit_Name(self, node):
+        if node.id not in _IMPLICIT_NAMES:
+            kind = self._classify(node.id)
+            if kind is not None:
+                self._add_at(node.lineno, node.col_offset, node.id, kind)
+
+    def visit_Attribute(self, node):
+        self.visit(node.value)
+        self._add_before_end(node, node.attr, 'attribute')
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self._add_before_end(alias, alias.asname, 'imported')
+            else:
+                self._add_at(alias.lineno, alias.col_offset, alias.name.split('.')[0], 'imported')
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == '*':
+                continue
+            self._add_before_end(alias, alias.asname or alias.name, 'imported')
+
+    def visit_arg(self, node):
+        if node.arg not in _IMPLICIT_NAMES:
+            self._add_at(node.lineno, node.col_offset, node.arg, 'parameter')
+
+    def _visit_arguments(self, args):
+        # Defaults and annotations belong to the enclosing scope.
+        for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            self.visit(default)
+        for arg in self._all_args(args):
+            if arg.annotation is not None:
+                self.visit(arg.annotation)
+
+    def _all_args(self, args):
+        arguments = args.posonlyargs + args.args + args.kwonlyargs
+        if args.vararg:
+            arguments.append(args.vararg)
+        if args.kwarg:
+            arguments.append(args.kwarg)
+        return arguments
+
+    def visit_FunctionDef(self, node):
+        self._add_definition_name(node, 'function_name')
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self._visit_arguments(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        self._enter(node.name, node.lineno)
+        for arg in self._all_args(node.args):
+            self.visit_arg(arg)
+        for statement in node.body:
+            self.visit(statement)
+        self._leave()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._add_definition_name(node, 'class_name')
+        for expression in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expression)
+        self._enter(node.name, node.lineno)
+        for statement in node.body:
+            self.visit(statement)
+        self._leave()
+
+    def visit_Lambda(self, node):
+        self._visit_arguments(node.args)
+        self._enter('lambda', node.lineno)
+        for arg in self._all_args(node.args):
+            self.visit_arg(arg)
+        self.visit(node.body)
+        self._leave()
+
+    def _visit_comprehension(self, node):
+        generators = node.generators
+        # The first iterable is evaluated in the enclosing scope.
+        self.visit(generators[0].iter)
+        self._enter(_COMPREHENSION_SCOPES[type(node)], node.lineno)
+        for index, generator in enumerate(generators):
+            self.visit(generator.target)
+            if index:
+                self.visit(generator.iter)
+            for condition in generator.ifs:
+                self.visit(condition)
+        if isinstance(node, ast.DictComp):
+            self.visit(node.key)
+            self.visit(node.value)
+        else:
+            self.visit(node.elt)
+        self._leave()
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+
+class SemanticCache:
+    """Analysis results keyed by content hash, shared by every editor tab."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        table = self._entries.get(key)
+        if table is not None:
+            self._entries.move_to_end(key)
+        return table
+
+    def put(self, key, table):
+        self._entries[key] = table
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,19 @@
+from completion import fuzzy_score
+
+
+def test_prefix_beats_word_start_match_for_long_query():
+    query = 'get_value_it'
+    prefix = fuzzy_score('get_value_items_from_the_cache', query)
+    other = fuzzy_score('x_get_value_it', query)
+    assert other is not None
+    assert prefix > other
+
+
+def test_prefix_beats_other_matches_for_long_names():
+    query = 'p'
+    assert fuzzy_score('p' + 'x' * 200, query) > fuzzy_score('a_p', query)
+
+
+def test_shorter_prefix_match_ranks_first():
+    assert fuzzy_score('parse', 'par') > fuzzy_score('parser_state', 'par')
+    assert fuzzy_score('Parse', 'Par') > fuzzy_score('parse', 'Par')
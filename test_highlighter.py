@@ -0,0 +1,24 @@
+from highlighter import TOKEN_FORMATS, lex_lines
+
+
+def lex_formats(lines):
+    rows = lex_lines(lines, 0, 0, bytearray(len(lines)), {})
+    return [{line[spans[i]:spans[i] + spans[i + 1]]: TOKEN_FORMATS[spans[i + 2]]
+             for i in range(0, len(spans), 3)}
+            for line, (spans, _) in zip(lines, rows)]
+
+
+def test_decorator_call_arguments_are_not_decorator():
+    formats = lex_formats(['@functools.lru_cache(maxsize=3, typed=True)', 'def f(): pass'])[0]
+    assert formats['@'] == 'decorator'
+    assert formats['functools'] == 'decorator'
+    assert formats['lru_cache'] == 'decorator'
+    assert 'maxsize' not in formats
+    assert 'typed' not in formats
+    assert formats['3'] == 'number'
+
+
+def test_decorator_ends_at_line_end():
+    formats = lex_formats(['@property', 'def value(self): pass'])
+    assert formats[0]['property'] == 'decorator'
+    assert formats[1]['value'] == 'function_name'
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QCoreApplication, Qt, pyqtSignal
+
+
+class TaskRunner(QObject):
+    """Run callables on background threads and report back on the GUI thread.
+
+    finished/failed are emitted with the key passed to submit(), always
+    through a queued connection, so slots never run inside submit() itself.
+    """
+
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object)
+    _done = pyqtSignal(object, object, object)
+
+    def __init__(self, name, max_workers=1, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._done.connect(self._deliver, Qt.QueuedConnection)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def submit(self, key, fn, *args, **kwargs):
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda f: self._on_future_done(key, f))
+        return future
+
+    def _on_future_done(self, key, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self._done.emit(key, None, error)
+        else:
+            self._done.emit(key, future.result(), None)
+
+    def _deliver(self, key, result, error):
+        if error is not None:
+            self.failed.emit(key, error)
+        else:
+            self.finished.emit(key, result)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
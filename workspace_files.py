@@ -0,0 +1,43 @@
+import os
+
+# Directories never worth indexing or searching.
+IGNORED_DIRS = frozenset((
+    '__pycache__', 'node_modules', 'venv', 'env', 'build', 'dist', 'site-packages',
+))
+
+
+def is_ignored_dir(name):
+    return name.startswith('.') or name in IGNORED_DIRS or name.endswith('.egg-info')
+
+
+def iter_files(folder, cancelled=None):
+    """Yield the os.DirEntry of every file under folder, skipping ignored
+    directories and not following directory symlinks."""
+    pending = [folder]
+    while pending:
+        if cancelled is not None and cancelled.is_set():
+            return
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored_dir(entry.name):
+                        pending.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+            except OSError:
+                continue
+
+
+def iter_python_files(folder, cancelled=None):
+    """Yield (path, mtime, size) for every .py file under folder."""
+    for entry in iter_files(folder, cancelled):
+        if entry.name.endswith('.py'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            yield entry.path, stat.st_mtime, stat.st_size
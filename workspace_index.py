@@ -0,0 +1,300 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ast
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+
+from PyQt5.QtCore import QObject, QCoreApplication, QStandardPaths, pyqtSignal
+
+from workers import TaskRunner
+from workspace_files import iter_python_files
+
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL COLLATE NOCASE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    column INTEGER NOT NULL,
+    container TEXT
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path);
+"""
+
+
+# ------------------------
+# Parsing (runs in the worker processes)
+# ------------------------
+def _target_names(target):
+    if isinstance(target, ast.Name):
+        yield target
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from _target_names(element)
+    elif isinstance(target, ast.Starred):
+        yield from _target_names(target.value)
+
+
+def extract_symbols(source):
+    """Return (name, kind, line, column, container) for the definitions,
+    classes, module-level assignments and imports in source. The container
+    of an import is the module it comes from (None for relative imports)."""
+    tree = ast.parse(source)
+    symbols = []
+
+    def visit_body(body, container):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = 'method' if container and container[1] == 'class' else 'function'
+                symbols.append((node.name, kind, node.lineno, node.col_offset, container and container[0]))
+                visit_body(node.body, (node.name, 'function'))
+            elif isinstance(node, ast.ClassDef):
+                symbols.append((node.name, 'class', node.lineno, node.col_offset, container and container[0]))
+                visit_body(node.body, (node.name, 'class'))
+            elif container is None and isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for name in _target_names(target):
+                        symbols.append((name.id, 'variable', name.lineno, name.col_offset, None))
+            elif container is None and isinstance(node, ast.Import):
+                for alias in node.names:
+                    name = alias.asname or alias.name.split('.')[0]
+                    symbols.append((name, 'import', node.lineno, node.col_offset, alias.name))
+            elif container is None and isinstance(node, ast.ImportFrom):
+                module = node.module if not node.level else None
+                for alias in node.names:
+                    if alias.name != '*':
+                        symbols.append((alias.asname or alias.name, 'import', node.lineno,
+                                        node.col_offset, module))
+            elif isinstance(node, (ast.If, ast.Try, ast.With, ast.AsyncWith)):
+                # Conditional definitions (platform checks, optional imports).
+                for block in (getattr(node, 'body', []), getattr(node, 'orelse', []),
+                              getattr(node, 'finalbody', [])):
+                    visit_body(block, container)
+                for handler in getattr(node, 'handlers', []):
+                    visit_body(handler.body, container)
+
+    visit_body(tree.body, None)
+    return symbols
+
+
+def index_files(files):
+    """Parse a batch of (path, mtime, size); files that fail to parse are
+    stored with no symbols so they are not retried until they change."""
+    results = []
+    for path, mtime, size in files:
+        try:
+            with open(path, 'rb') as file:
+                source = file.read()
+            symbols = extract_symbols(source)
+        except (OSError, SyntaxError, ValueError, RecursionError):
+            symbols = []
+        results.append((path, mtime, size, symbols))
+    return results
+
+
+# ------------------------
+# Index
+# ------------------------
+def default_database_path(folder):
+    cache = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation) \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.blake2b(os.path.abspath(folder).encode('utf-8', 'surrogatepass'),
+                             digest_size=12).hexdigest()
+    return os.path.join(cache, 'python-ide', 'index', digest + '.sqlite')
+
+
+def open_database(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        connection.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS symbols;')
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    connection.executescript(_SCHEMA)
+    connection.commit()
+    return connection
+
+
+def build_index(folder, database_path, cancelled, progress, max_workers=None, batch_size=64):
+    """Bring the database for folder up to date; runs on a worker thread.
+
+    Files whose mtime and size match the stored row are not parsed again,
+    the rest are parsed in a process pool and written batch by batch.
+    """
+    connection = open_database(database_path)
+    try:
+        stored = {path: (mtime, size) for path, mtime, size
+                  in connection.execute('SELECT path, mtime, size FROM files')}
+        stale = []
+        seen = set()
+        for path, mtime, size in iter_python_files(folder, cancelled):
+            seen.add(path)
+            if stored.get(path) != (mtime, size):
+                stale.append((path, mtime, size))
+        if cancelled.is_set():
+            return None
+
+        removed = [(path,) for path in stored.keys() - seen]
+        if removed:
+            connection.executemany('DELETE FROM symbols WHERE path = ?', removed)
+            connection.executemany('DELETE FROM files WHERE path = ?', removed)
+            connection.commit()
+
+        done = 0
+        progress(done, len(stale))
+        if stale:
+            batches = [stale[i:i + batch_size] for i in range(0, len(stale), batch_size)]
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+                futures = [pool.submit(index_files, batch) for batch in batches]
+                try:
+                    for future in as_completed(futures):
+                        if cancelled.is_set():
+                            return None
+                        results = future.result()
+                        _store(connection, results)
+                        done += len(results)
+                        progress(done, len(stale))
+                finally:
+                    for future in futures:
+                        future.cancel()
+        return {'files': len(seen), 'parsed': len(stale), 'removed': len(removed)}
+    finally:
+        connection.close()
+
+
+def _store(connection, results):
+    with connection:
+        paths = [(path,) for path, _, _, _ in results]
+        connection.executemany('DELETE FROM symbols WHERE path = ?', paths)
+        connection.executemany(
+            'INSERT INTO symbols (name, kind, path, line, column, container) VALUES (?, ?, ?, ?, ?, ?)',
+            [(name, kind, path, line, column, container)
+             for path, _, _, symbols in results
+             for name, kind, line, column, container in symbols])
+        connection.executemany(
+            'INSERT OR REPLACE INTO files (path, mtime, size) VALUES (?, ?, ?)',
+            [(path, mtime, size) for path, mtime, size, _ in results])
+
+
+def _like_pattern(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class WorkspaceIndex(QObject):
+    """Symbols of every .py file in the workspace folder, kept in SQLite.
+
+    open() starts a background refresh; queries read whatever is stored,
+    so a workspace indexed before is searchable immediately.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = None
+        self.database_path = None
+        self._connection = None
+        self._cancelled = threading.Event()
+        self._progress = _ProgressRelay()
+        self._progress.changed.connect(self.progress)
+        self._runner = TaskRunner('workspace-index', parent=self)
+        self._runner.finished.connect(self._on_built)
+        self._runner.failed.connect(self._on_failed)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.close)
+
+    def open(self, folder, database_path=None):
+        self.close()
+        self.folder = os.path.abspath(folder)
+        self.database_path = database_path or default_database_path(self.folder)
+        try:
+            self._connection = open_database(self.database_path)
+        except sqlite3.Error:
+            self._connection = None
+            return
+        self.refresh()
+
+    def refresh(self):
+        if self._connection is None:
+            return
+        self._cancelled.set()
+        self._cancelled = threading.Event()
+        self._runner.submit(self._cancelled, build_index, self.folder, self.database_path,
+                            self._cancelled, self._progress.changed.emit)
+
+    def close(self):
+        self._cancelled.set()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def is_open(self):
+        return self._connection is not None
+
+    def _on_built(self, cancelled, summary):
+        if cancelled is self._cancelled and summary is not None:
+            self.finished.emit(summary)
+
+    def _on_failed(self, cancelled, error):
+        if cancelled is self._cancelled:
+            self.finished.emit({'error': str(error)})
+
+    # ------------------------
+    # Queries
+    # ------------------------
+    def find_symbols(self, text, limit=200):
+        """Symbols whose name contains text, prefix matches first."""
+        if self._connection is None:
+            return []
+        pattern = _like_pattern(text)
+        return self._connection.execute(
+            "SELECT name, kind, path, line, column, container FROM symbols "
+            "WHERE name LIKE ? ESCAPE '\\' "
+            "ORDER BY name NOT LIKE ? ESCAPE '\\', length(name), name, path LIMIT ?",
+            ('%' + pattern + '%', pattern + '%', limit)).fetchall()
+
+    def definitions(self, name, limit=50):
+        if self._connection is None:
+            return []
+        return self._connection.execute(
+            "SELECT name, kind, path, line, column, container FROM symbols "
+            "WHERE name = ? AND kind != 'import' ORDER BY path, line LIMIT ?",
+            (name, limit)).fetchall()
+
+    def completions(self, prefix, limit=500):
+        if self._connection is None or not prefix:
+            return []
+        rows = self._connection.execute(
+            "SELECT DISTINCT name FROM symbols WHERE name LIKE ? ESCAPE '\\' "
+            "AND kind != 'import' LIMIT ?",
+            (_like_pattern(prefix) + '%', limit))
+        return [row[0] for row in rows]
+
+    def imported_modules(self, limit=30):
+        """Absolute imports in the workspace, most widely imported first."""
+        if self._connection is None:
+            return []
+        rows = self._connection.execute(
+            "SELECT container FROM symbols WHERE kind = 'import' AND container IS NOT NULL "
+            "GROUP BY container ORDER BY COUNT(DISTINCT path) DESC, container LIMIT ?",
+            (limit,))
+        return [row[0] for row in rows]
+
+
+class _ProgressRelay(QObject):
+    # Emitted from the index thread; Qt queues it to the GUI thread.
+    changed = pyqtSignal(int, int)